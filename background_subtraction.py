@@ -0,0 +1,520 @@
+"""
+  Rolling ball background subtraction of 2D images with NumPy. Follows ImageJ's Background Subtracter
+  (https://imagej.net/ij/developer/source/ij/plugin/filter/BackgroundSubtracter.java.html) and gives the same results
+  as the pure Python port cv2_rolling_ball (https://pypi.org/project/opencv-rolling-ball/) in seconds instead of hours.
+
+  Based on the concept of the rolling ball algorithm described in Stanley Sternberg's article, "Biomedical Image
+  Processing", IEEE Computer, January 1983. Imagine that the 2D grayscale image has a third (height) dimension by the
+  image value at every point in the image, creating a surface. A ball of given radius is rolled over the bottom side of
+  this surface; the hull of the volume reachable by the ball is the background.
+
+  Documentation:
+
+      Include in your project as "import background_subtraction" or
+      "from background_subtraction import subtract_background_rolling_ball" (a drop-in replacement for the function of
+      the same name in cv2_rolling_ball with the same parameters and defaults, including use_paraboloid)
+
+      - "img, background = subtract_background_rolling_ball(img, radius)" returns the background subtracted image and
+        the background (both with the data type of img, img itself is not changed)
+      - light_background=True (the default, as in cv2_rolling_ball) for images with a light background (the ball is
+        rolled over the top side), pass light_background=False for fluorescence images (dark background)
+      - do_presmooth=True smooths the image with a 3x3 mean filter before the background is computed (the smoothed
+        image is also the one the background is subtracted from, as in cv2_rolling_ball)
+      - As in ImageJ, the image is shrunk for large balls (radius > 10: by 2, > 30: by 4, > 100: by 8, taking the
+        minimum of each block), the ball is rolled over the small image and the background is interpolated back
+      - Rolling the ball is a grey scale opening (erosion followed by dilation) with the ball as non-flat structuring
+        element, which is computed with vectorized minima and maxima over shifted copies of the image (the ball is
+        split into its rows, each row is applied once to a band of image rows)
+      - "subtract_background_rolling_ball(img, radius, workers=N)" rolls the ball on N processes, the (shrunk) image is
+        split into tiles (bands of rows) with a halo of twice the radius of the ball on each side and shared with the
+        processes through shared memory; the result is identical to the one of a single process (not used for the
+        sliding paraboloid)
+      - use_paraboloid=True uses a sliding paraboloid (with the curvature of a ball of the given radius at its apex)
+        instead of the ball. The paraboloid is separable, so the grey scale opening with it is computed by 1D lower
+        envelope transforms (as in distance transforms by Felzenszwalb and Huttenlocher) along Y and X, which take time
+        linear in the number of pixels, independent of the radius (no shrinking, the center of the paraboloid may lie up
+        to radius pixels outside of the image). Unlike ImageJ's sliding paraboloid (1D slides along rows, columns and
+        diagonals) this is an exact 2D opening, so the results differ slightly from the ones of cv2_rolling_ball.
+      - "subtract_background_rolling_ball(img, radius, time_budget=60)" limits the time of the rolling ball: if it is
+        predicted to take longer (predict_rolling_ball_seconds, a cost model from the image size, the radius and the
+        speed of this computer measured once) or it actually does, a faster approximation with a larger shrink factor
+        is used instead (in total it takes at most about twice the budget), "run_log=records" appends a record of the
+        decision (dict) to the list records, write_run_log(path, records) saves them as JSON lines
+      - Integer images (8 bit, 16 bit, ...) are rounded and clipped to the range of their data type, float images are
+        returned as float
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from datetime import datetime
+import json
+import math
+import os
+import time
+import numpy as np
+
+# number of image rows processed at once by the grey scale morphology (keeps the temporary arrays small)
+MORPHOLOGY_BAND_ROWS = 128
+
+# minimal number of rows of a tile (without halo) when rolling the ball on several processes
+MIN_TILE_ROWS = 64
+
+# cost model: elementary operations per pixel for smoothing, shrinking, enlarging and subtracting (the operations of the
+# grey scale morphology depend on the size of the ball), measured seconds per operation (see _seconds_per_operation)
+LINEAR_OPERATIONS_PER_PIXEL = 25
+_seconds_per_operation_measured = None
+
+
+def subtract_background_rolling_ball(img: np.ndarray, radius: float, light_background: bool = True,
+                                     use_paraboloid: bool = False, do_presmooth: bool = True, workers: int = 1,
+                                     time_budget: float = None, run_log: list = None):
+    """
+    Calculates and subtracts the background of a 2D image with the rolling ball algorithm.
+
+    :param img: 2D image (NumPy array, usually uint8)
+    :param radius: Radius of the rolling ball (in pixels)
+    :param light_background: Whether the image has a light background
+    :param use_paraboloid: Whether to use the "sliding paraboloid" algorithm instead of the rolling ball
+    :param do_presmooth: Whether the image should be smoothed (3x3 mean) before creating the background. With
+        smoothing, the background will not necessarily be below the image data.
+    :param workers: Number of processes rolling the ball on tiles of the image (not for the sliding paraboloid), the
+        default 1 rolls it in this process without starting any processes, None uses one process per CPU (call it
+        from within an "if __name__ == '__main__':" block then)
+    :param time_budget: Seconds the rolling ball may take before a faster approximation (larger shrink factor) is used
+        instead, None for no limit
+    :param run_log: List that a record (dict) of the method used, the predicted and the actual time is appended to
+    :return: Tuple of the background subtracted image and the background (with the data type of img)
+    """
+    img = np.asarray(img)
+    if img.ndim != 2:
+        raise ValueError('Expected a 2D image, got an array with shape {}.'.format(img.shape))
+    if radius <= 0:
+        raise ValueError('The radius must be positive.')
+
+    start = time.time()
+    workers = workers or os.cpu_count() or 1
+    record = {'time': datetime.now().isoformat(timespec='seconds'), 'shape': list(img.shape), 'radius': radius,
+              'light_background': light_background, 'time_budget': time_budget}
+    if do_presmooth:
+        img = _smooth(img)
+    if use_paraboloid:
+        record.update(method='sliding paraboloid', reason='sliding paraboloid requested')
+        background = _sliding_paraboloid_background(img, radius, light_background)
+    else:
+        background = _rolling_ball_within_budget(img, radius, light_background, workers, start, time_budget, record)
+    result = _subtract(img, background, light_background)
+    record['seconds'] = round(time.time() - start, 3)
+    if run_log is not None:
+        run_log.append(record)
+    return result
+
+
+def predict_rolling_ball_seconds(shape: tuple, radius: float, shrink_factor: int = None, workers: int = 1) -> float:
+    """
+    Predicts the time of the rolling ball background subtraction of an image from the number of elementary operations
+    (of the grey scale morphology on the shrunk image and of the steps on the whole image) and the speed of this
+    computer (measured once by a small calibration run).
+
+    :param shape: Shape of the image (height, width)
+    :param radius: Radius of the rolling ball
+    :param shrink_factor: Shrink factor (default as in ImageJ, see RollingBall)
+    :param workers: Number of processes rolling the ball (None for one per CPU, as in subtract_background_rolling_ball)
+    :return: Predicted time in seconds
+    """
+    workers = workers or os.cpu_count() or 1
+    ball = RollingBall(radius, shrink_factor)
+    half_width = ball.width // 2
+    small_height, small_width = shape[0] // ball.shrink_factor, shape[1] // ball.shrink_factor
+    tiles = max(min(workers, small_height // MIN_TILE_ROWS, os.cpu_count() or 1), 1)
+    extended = (small_height + 2 * half_width) * (small_width + 2 * half_width)
+    morphology = 2 * extended * _morphology_operations(half_width) / tiles
+    linear = shape[0] * shape[1] * LINEAR_OPERATIONS_PER_PIXEL
+    return (morphology + linear) * _seconds_per_operation()
+
+
+def write_run_log(file_path: str, records: list):
+    """
+    Appends records (dicts, e.g. from the run_log of subtract_background_rolling_ball) to a JSON lines file.
+
+    :param file_path: Path of the log file
+    :param records: List of dicts
+    """
+    with open(file_path, 'a') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+
+class RollingBall:
+    """
+    A rolling ball (or actually a square part thereof) as in ImageJ. Also determines by which factor the image is
+    shrunk before the ball is rolled.
+    """
+
+    def __init__(self, radius: float, shrink_factor: int = None):
+        """
+        :param radius: Radius of the ball in pixels of the original image
+        :param shrink_factor: Shrink factor of the image (default depends on the radius)
+        """
+        if radius <= 10:
+            self.shrink_factor = 1
+            arc_trim_per = 24  # trim 24% in x and y
+        elif radius <= 30:
+            self.shrink_factor = 2
+            arc_trim_per = 24
+        elif radius <= 100:
+            self.shrink_factor = 4
+            arc_trim_per = 32
+        else:
+            self.shrink_factor = 8
+            arc_trim_per = 40
+        if shrink_factor is not None:
+            self.shrink_factor = shrink_factor
+
+        small_ball_radius = max(radius / self.shrink_factor, 1)
+        r_square = small_ball_radius * small_ball_radius
+        x_trim = int(arc_trim_per * small_ball_radius / 100)  # only use a patch of the ball
+        half_width = round(small_ball_radius - x_trim)
+        self.width = 2 * half_width + 1
+        y, x = np.mgrid[-half_width:half_width + 1, -half_width:half_width + 1]
+        temp = r_square - x * x - y * y
+        self.data = np.sqrt(np.maximum(temp, 0))  # height of the ball, 0 outside of it
+
+
+def _smooth(img: np.ndarray) -> np.ndarray:
+    """
+    For internal use only. 3x3 mean filter (borders are mirrored without repeating the edge pixels), integer images
+    are rounded to their data type.
+    """
+    height, width = img.shape
+    padded = np.pad(img.astype(np.float64), 1, mode='reflect')
+    total = np.zeros((height, width))
+    for dy in range(3):
+        for dx in range(3):
+            total += padded[dy:dy + height, dx:dx + width]
+    if np.issubdtype(img.dtype, np.integer):
+        return np.rint(total / 9).astype(img.dtype)
+    return (total / 9).astype(img.dtype)
+
+
+def _rolling_ball_within_budget(img: np.ndarray, radius: float, invert: bool, workers: int, start: float,
+                                time_budget: float, record: dict) -> np.ndarray:
+    """
+    For internal use only. Rolling ball background, with a larger shrink factor than the default one if the default is
+    predicted to take longer than the time budget (from start) or is stopped because it does. The decision is stored in
+    record.
+    """
+    default = RollingBall(radius).shrink_factor
+    predicted = predict_rolling_ball_seconds(img.shape, radius, workers=workers)
+    record.update(method='rolling ball', shrink_factor=default, predicted_seconds=round(predicted, 3))
+    if time_budget is None:
+        record['reason'] = 'no time budget'
+        return _rolling_ball_background(img, radius, invert, workers)
+
+    if predicted <= time_budget - (time.time() - start):
+        try:
+            background = _rolling_ball_background(img, radius, invert, workers, deadline=start + time_budget)
+            record['reason'] = 'within time budget'
+            return background
+        except TimeoutError:
+            record['reason'] = 'exceeded time budget'  # the approximation gets the whole budget again
+    else:
+        record['reason'] = 'predicted to exceed time budget'
+
+    # smallest larger shrink factor that is predicted to fit into the budget (or the largest one that keeps the ball at
+    # least one pixel large)
+    shrink_factor = default
+    while 2 * shrink_factor <= max(radius, 2) and min(img.shape) // (2 * shrink_factor) >= 2:
+        shrink_factor *= 2
+        predicted = predict_rolling_ball_seconds(img.shape, radius, shrink_factor, workers)
+        if predicted <= time_budget:
+            break
+    record.update(method='rolling ball approximation', shrink_factor=shrink_factor,
+                  predicted_seconds=round(predicted, 3))
+    return _rolling_ball_background(img, radius, invert, workers, shrink_factor)
+
+
+def _rolling_ball_background(img: np.ndarray, radius: float, invert: bool, workers: int = 1, shrink_factor: int = None,
+                             deadline: float = None) -> np.ndarray:
+    """
+    For internal use only. Background of an image (as float64) by rolling a ball of the given radius over the bottom
+    side (or the top side if invert) of the image, for large balls on a shrunk image. The ball is rolled on tiles of
+    the image on several processes if workers > 1. Raises TimeoutError if not done by the deadline (time.time()).
+    """
+    ball = RollingBall(radius, shrink_factor)
+    maximum = _maximum(img.dtype)
+    image = img.astype(np.float64)
+    if invert:
+        image = maximum - image
+
+    shrink_factor = ball.shrink_factor
+    if shrink_factor > 1 and min(image.shape) // shrink_factor < 2:
+        shrink_factor = 1  # too small for interpolating the shrunk image
+    if shrink_factor > 1:
+        small_image = _shrink(image, shrink_factor)
+        background = _enlarge(_roll_ball_tiled(small_image, ball.data, workers, deadline), image.shape, shrink_factor)
+    else:
+        background = _roll_ball_tiled(image, ball.data, workers, deadline)
+
+    if invert:
+        background = maximum - background
+    return background
+
+
+def _sliding_paraboloid_background(img: np.ndarray, radius: float, invert: bool) -> np.ndarray:
+    """
+    For internal use only. Background of an image (as float64) by sliding a paraboloid z = -(x^2 + y^2) / (2 radius)
+    over the bottom side (or the top side if invert) of the image: a grey scale erosion followed by a dilation with the
+    paraboloid, both separable into 1D lower envelope transforms along Y and X.
+    """
+    coefficient = 0.5 / radius
+    maximum = _maximum(img.dtype)
+    image = img.astype(np.float64)
+    if invert:
+        image = maximum - image
+    height, width = image.shape
+    margin = min(math.ceil(radius), max(height, width))
+
+    # lowest position of the paraboloid for centers up to margin pixels outside of the image (transposed after X)
+    lowest = _lower_envelope(image, coefficient, 0, -margin, height + margin)
+    lowest = _lower_envelope(np.ascontiguousarray(lowest.T), coefficient, 0, -margin, width + margin)
+
+    # highest point of all paraboloids at every pixel, max(a - b) = -min(-a + b)
+    background = -_lower_envelope(-lowest, coefficient, -margin, 0, width)
+    background = -_lower_envelope(-np.ascontiguousarray(background.T), coefficient, -margin, 0, height)
+
+    if invert:
+        background = maximum - background
+    return background
+
+
+def _lower_envelope(values: np.ndarray, coefficient: float, site_start: int, start: int, stop: int) -> np.ndarray:
+    """
+    For internal use only. Lower envelope of parabolas along the first axis of values (for all columns at once): for
+    every position p in [start, stop) the minimum over all sites q of values[q] + coefficient * (p - q)^2, where site q
+    is at position site_start + q. Linear in the number of values (Felzenszwalb and Huttenlocher, "Distance Transforms
+    of Sampled Functions", 2012), the sites are added one after the other, all columns at once.
+    """
+    length, columns = values.shape
+    indices = np.arange(columns)
+    positions = site_start + np.arange(length, dtype=np.float64)
+    heights = values + (coefficient * positions * positions)[:, np.newaxis]  # parabolas as lines in p after - c p^2
+    scale = 0.5 / coefficient
+
+    # parabolas of the envelope (as stacks, one per column) and the positions where they start to be the lowest
+    sites = np.empty((length, columns), dtype=np.intp)
+    starts = np.empty((length, columns))
+    sites[0] = 0
+    starts[0] = -np.inf
+    top = np.zeros(columns, dtype=np.intp)
+    top_site = np.zeros(columns, dtype=np.intp)
+    top_height = heights[0].copy()
+    top_start = starts[0].copy()
+    intersection = np.empty(columns)
+    for q in range(1, length):
+        height = heights[q]
+        np.subtract(height, top_height, out=intersection)
+        intersection *= scale / (q - top_site)
+        hidden = np.flatnonzero(intersection <= top_start)  # the top parabola is nowhere the lowest anymore
+        while hidden.size:
+            top[hidden] -= 1
+            site = sites[top[hidden], hidden]
+            top_site[hidden] = site
+            top_height[hidden] = heights[site, hidden]
+            top_start[hidden] = starts[top[hidden], hidden]
+            intersection[hidden] = (height[hidden] - top_height[hidden]) * scale / (q - site)
+            hidden = hidden[intersection[hidden] <= top_start[hidden]]
+        top += 1
+        sites[top, indices] = q
+        starts[top, indices] = intersection
+        top_site[:] = q
+        top_height[:] = height
+        top_start[:] = intersection
+
+    # the parabola of the envelope at every output position is the number of parabola starts up to it
+    size = stop - start
+    used = np.arange(1, length)[:, np.newaxis] <= top
+    rows = np.clip(np.ceil(starts[1:] - start), 0, size).astype(np.intp)
+    counts = np.bincount((rows * columns + indices)[used], minlength=(size + 1) * columns)
+    envelope = np.take_along_axis(sites, counts.reshape(size + 1, columns)[:size].cumsum(axis=0), axis=0)
+    distances = np.arange(start, stop, dtype=np.float64)[:, np.newaxis] - (site_start + envelope)
+    return np.take_along_axis(values, envelope, axis=0) + coefficient * distances * distances
+
+
+def _maximum(dtype) -> float:
+    """
+    For internal use only. Value that an image is inverted against (maximum of integer data types, 0 for floats).
+    """
+    return float(np.iinfo(dtype).max) if np.issubdtype(dtype, np.integer) else 0.0
+
+
+def _shrink(image: np.ndarray, shrink_factor: int) -> np.ndarray:
+    """
+    For internal use only. Shrinks an image by taking the minimum of each block of shrink_factor x shrink_factor pixels
+    (the remaining rows and columns at the bottom and right are ignored).
+    """
+    s_height, s_width = image.shape[0] // shrink_factor, image.shape[1] // shrink_factor
+    blocks = image[:s_height * shrink_factor, :s_width * shrink_factor].reshape(
+        s_height, shrink_factor, s_width, shrink_factor)
+    return blocks.min(axis=(1, 3))
+
+
+def _enlarge(small_image: np.ndarray, shape: tuple, shrink_factor: int) -> np.ndarray:
+    """
+    For internal use only. Enlarges a shrunk image to the given shape by bilinear interpolation (extrapolated at the
+    borders).
+    """
+    y_indices, y_weights = _interpolation_arrays(shape[0], small_image.shape[0], shrink_factor)
+    x_indices, x_weights = _interpolation_arrays(shape[1], small_image.shape[1], shrink_factor)
+    lines = small_image[:, x_indices] * x_weights + small_image[:, x_indices + 1] * (1.0 - x_weights)
+    y_weights = y_weights[:, np.newaxis]
+    return lines[y_indices] * y_weights + lines[y_indices + 1] * (1.0 - y_weights)
+
+
+def _interpolation_arrays(length: int, s_length: int, shrink_factor: int):
+    """
+    For internal use only. Index of the first of the two pixels of the shrunk image that every pixel is interpolated
+    from and the weight of that first pixel.
+    """
+    positions = np.arange(length)
+    s_indices = np.trunc((positions - shrink_factor / 2) / shrink_factor).astype(np.intp)
+    s_indices = np.minimum(s_indices, s_length - 2)
+    distances = (positions + 0.5) / shrink_factor - (s_indices + 0.5)
+    return s_indices, 1.0 - distances
+
+
+def _roll_ball(image: np.ndarray, ball: np.ndarray, deadline: float = None) -> np.ndarray:
+    """
+    For internal use only. Rolls a ball over the bottom side of an image, which is a grey scale opening with the ball
+    as structuring element. The ball may stick out of the image (its center is moved over an area extended by the
+    radius of the ball on every side), pixels outside of the image are ignored.
+    """
+    radius = ball.shape[0] // 2
+    extended = np.pad(image, radius, constant_values=np.inf)
+    lowest = _morphology(extended, ball, True, deadline)  # lowest position of the ball at every center
+    background = _morphology(lowest, ball, False, deadline)
+    return background[radius:radius + image.shape[0], radius:radius + image.shape[1]]
+
+
+def _roll_ball_tiled(image: np.ndarray, ball: np.ndarray, workers: int, deadline: float = None) -> np.ndarray:
+    """
+    For internal use only. Like _roll_ball, but on tiles (bands of rows) of the image on several processes. The image
+    and the result are shared with the processes through shared memory. Every tile is extended by a halo of twice the
+    radius of the ball (the pixels an opened pixel depends on), so the result is identical to the one of _roll_ball.
+    """
+    height = image.shape[0]
+    halo = 2 * (ball.shape[0] // 2)
+    tiles = min(workers, height // MIN_TILE_ROWS)
+    if tiles <= 1:
+        return _roll_ball(image, ball, deadline)
+    bounds = np.linspace(0, height, tiles + 1).astype(int)
+
+    input_memory = shared_memory.SharedMemory(create=True, size=image.nbytes)
+    output_memory = shared_memory.SharedMemory(create=True, size=image.nbytes)
+    try:
+        np.ndarray(image.shape, dtype=np.float64, buffer=input_memory.buf)[...] = image
+        with ProcessPoolExecutor(max_workers=tiles) as executor:
+            futures = [executor.submit(_roll_ball_tile, input_memory.name, output_memory.name, image.shape, ball,
+                                       int(y0), int(y1), halo, deadline) for y0, y1 in zip(bounds[:-1], bounds[1:])]
+            for future in futures:
+                future.result()
+        return np.ndarray(image.shape, dtype=np.float64, buffer=output_memory.buf).copy()
+    finally:
+        for memory in (input_memory, output_memory):
+            memory.close()
+            memory.unlink()
+
+
+def _roll_ball_tile(input_name: str, output_name: str, shape: tuple, ball: np.ndarray, y0: int, y1: int, halo: int,
+                    deadline: float = None):
+    """
+    For internal use only. Rolls the ball over the rows [y0, y1) (plus halo) of an image in shared memory and writes
+    the rows [y0, y1) of the result into shared memory (runs in a worker process).
+    """
+    input_memory = shared_memory.SharedMemory(name=input_name)
+    output_memory = shared_memory.SharedMemory(name=output_name)
+    try:
+        image = np.ndarray(shape, dtype=np.float64, buffer=input_memory.buf)
+        output = np.ndarray(shape, dtype=np.float64, buffer=output_memory.buf)
+        top, bottom = max(y0 - halo, 0), min(y1 + halo, shape[0])
+        output[y0:y1] = _roll_ball(image[top:bottom], ball, deadline)[y0 - top:y1 - top]
+        del image, output  # release the buffers before closing
+    finally:
+        input_memory.close()
+        output_memory.close()
+
+
+def _morphology(image: np.ndarray, ball: np.ndarray, erode: bool, deadline: float = None) -> np.ndarray:
+    """
+    For internal use only. Grey scale erosion (or dilation) of an image with a symmetric non-flat structuring element,
+    pixels outside of the image are +inf (-inf for the dilation). The structuring element is split into its rows, each
+    row is first applied along X to a band of image rows (as minimum of the pairs of pixels at the same distance to
+    the center), then the rows are combined along Y. Raises TimeoutError if a band is started after the deadline.
+    """
+    radius = ball.shape[0] // 2
+    combine = np.minimum if erode else np.maximum
+    apply = np.subtract if erode else np.add
+    height, width = image.shape
+    padded = np.pad(image, radius, constant_values=np.inf if erode else -np.inf)
+    result = np.empty_like(image)
+    for y0 in range(0, height, MORPHOLOGY_BAND_ROWS):
+        if deadline is not None and time.time() > deadline:
+            raise TimeoutError('The rolling ball did not finish within its time budget.')
+        y1 = min(y0 + MORPHOLOGY_BAND_ROWS, height)
+        rows = padded[y0:y1 + 2 * radius]
+        center = rows[:, radius:radius + width]
+        pair = np.empty_like(center)
+
+        # every row of the ball applied along X (the ball is symmetric, so row -dy equals row dy)
+        applied = []
+        for dy in range(radius + 1):
+            profile = ball[radius + dy]
+            line = apply(center, profile[radius])
+            for dx in range(1, radius + 1):
+                combine(rows[:, radius + dx:radius + dx + width], rows[:, radius - dx:radius - dx + width], out=pair)
+                apply(pair, profile[radius + dx], out=pair)
+                combine(line, pair, out=line)
+            applied.append(line)
+
+        # combine the rows along Y
+        out = result[y0:y1]
+        out[...] = applied[0][radius:radius + y1 - y0]
+        for dy in range(1, radius + 1):
+            combine(out, applied[dy][radius + dy:radius + dy + y1 - y0], out=out)
+            combine(out, applied[dy][radius - dy:radius - dy + y1 - y0], out=out)
+    return result
+
+
+def _morphology_operations(half_width: int) -> int:
+    """
+    For internal use only. Elementary operations per pixel of _morphology with a ball of the given half width.
+    """
+    return (half_width + 1) * (3 * half_width + 1) + 2 * half_width + 1
+
+
+def _seconds_per_operation() -> float:
+    """
+    For internal use only. Seconds per elementary operation of the grey scale morphology on this computer, measured
+    once with two bands of rows of a wide image (so that the temporary arrays do not fit into the caches either).
+    """
+    global _seconds_per_operation_measured
+    if _seconds_per_operation_measured is None:
+        ball = RollingBall(10).data
+        image = np.random.default_rng(0).random((2 * MORPHOLOGY_BAND_ROWS, 2048))
+        start = time.perf_counter()
+        _morphology(image, ball, True)
+        seconds = time.perf_counter() - start
+        _seconds_per_operation_measured = seconds / (image.size * _morphology_operations(ball.shape[0] // 2))
+    return _seconds_per_operation_measured
+
+
+def _subtract(img: np.ndarray, background: np.ndarray, invert: bool):
+    """
+    For internal use only. Subtracts the background from the image (for a light background the result is shifted to
+    the maximum of the data type), integer results are rounded and clipped to the range of the data type.
+    """
+    if not np.issubdtype(img.dtype, np.integer):
+        return (img - background).astype(img.dtype), background.astype(img.dtype)
+    info = np.iinfo(img.dtype)
+    offset = info.max + 0.5 if invert else 0.5
+    subtracted = np.clip(img - background + offset, info.min, info.max)
+    return subtracted.astype(img.dtype), np.clip(background, info.min, info.max).astype(img.dtype)
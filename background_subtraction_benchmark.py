@@ -0,0 +1,171 @@
+"""
+  Benchmarks for the rolling ball (and sliding paraboloid) background subtraction in background_subtraction.py.
+  Validates the results against cv2_rolling_ball (if installed) on a small synthetic image and measures the time for a
+  large synthetic 8 bit image (or an 8 bit conversion of the first stack of an ".obf"/".msr" file given as first command
+  line argument), with the ball rolled on one and on several processes, checks the cost model of the time budget and
+  compares a rerun with the background taken from the derived_cache.py cache.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import background_subtraction
+import derived_cache
+import obf_support
+from obf_support_benchmark import measure, synthetic_image
+
+
+def synthetic_8bit_image(shape: tuple) -> np.ndarray:
+    """
+    Smooth synthetic image with noise and bright spots (in the 8 bit range).
+    """
+    rng = np.random.default_rng(1)
+    image = synthetic_image(shape).astype(np.float64) / 3 + 100 * (rng.random(shape) > 0.98)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def validate(image: np.ndarray, radii: tuple = (5, 10, 25, 50)):
+    """
+    Compares the background subtracted images and backgrounds with the ones of cv2_rolling_ball (with and without
+    light background and presmoothing). Prints the number of differing pixels and the maximal difference.
+    """
+    try:
+        from cv2_rolling_ball import subtract_background_rolling_ball
+    except ImportError:
+        print('cv2_rolling_ball is not installed, skipping the validation')
+        return
+
+    print('comparing with cv2_rolling_ball on a {} image'.format(image.shape))
+    for radius in radii:
+        for light_background in (False, True):
+            for do_presmooth in (False, True):
+                start = time.perf_counter()
+                expected = subtract_background_rolling_ball(image.copy(), radius, light_background=light_background,
+                                                            use_paraboloid=False, do_presmooth=do_presmooth)
+                seconds = time.perf_counter() - start
+                actual = background_subtraction.subtract_background_rolling_ball(
+                    image, radius, light_background=light_background, do_presmooth=do_presmooth)
+                differences = [np.abs(a.astype(np.int64) - e) for a, e in zip(actual, expected)]
+                print('  radius {:>3}, light {:d}, presmooth {:d}: {} / {} differing pixels (max {} / {}), '
+                      'cv2_rolling_ball {:.2f} s'.format(radius, light_background, do_presmooth,
+                                                         *[np.count_nonzero(d) for d in differences],
+                                                         *[d.max() for d in differences], seconds))
+
+
+def validate_paraboloid(image: np.ndarray, radii: tuple = (5, 10, 50)):
+    """
+    Compares the backgrounds of the sliding paraboloid with the ones of cv2_rolling_ball (an exact 2D opening against
+    ImageJ's 1D slides, so they are not identical). Prints the mean and maximal difference inside the image and in the
+    corners (which ImageJ corrects separately).
+    """
+    try:
+        from cv2_rolling_ball import subtract_background_rolling_ball
+    except ImportError:
+        print('cv2_rolling_ball is not installed, skipping the validation of the sliding paraboloid')
+        return
+
+    print('comparing the sliding paraboloid with cv2_rolling_ball on a {} image'.format(image.shape))
+    border = max(image.shape) // 10
+    for radius in radii:
+        for light_background in (False, True):
+            _, expected = subtract_background_rolling_ball(image.copy(), radius, light_background=light_background,
+                                                           use_paraboloid=True, do_presmooth=True)
+            _, actual = background_subtraction.subtract_background_rolling_ball(
+                image, radius, light_background=light_background, use_paraboloid=True)
+            difference = np.abs(actual.astype(np.int64) - expected)
+            inner = difference[border:-border, border:-border]
+            print('  radius {:>3}, light {:d}: inside mean {:.2f} max {}, whole image mean {:.2f} max {}'.format(
+                radius, light_background, inner.mean(), inner.max(), difference.mean(), difference.max()))
+
+
+def benchmark(image: np.ndarray, radii: tuple = (10, 25, 50, 150, 500)):
+    """
+    Measures the time of the background subtraction with the rolling ball and the sliding paraboloid for different
+    radii.
+    """
+    print('subtracting the background of a {} image'.format(image.shape))
+    for use_paraboloid in (False, True):
+        for radius in radii:
+            seconds, peak = measure(lambda: background_subtraction.subtract_background_rolling_ball(
+                image, radius, light_background=False, use_paraboloid=use_paraboloid), repeats=1)
+            print('  {:<10} radius {:>3} {:8.2f} s, peak memory {:8.1f} MB'.format(
+                'paraboloid' if use_paraboloid else 'ball', radius, seconds, peak / 1e6))
+
+
+def benchmark_workers(image: np.ndarray, radius: float = 10):
+    """
+    Measures the time of the background subtraction with the ball rolled on tiles on different numbers of processes
+    and checks that the results are identical to the ones of a single process.
+    """
+    print('subtracting the background of a {} image on several processes (radius {}, {} CPUs)'.format(
+        image.shape, radius, os.cpu_count()))
+    expected = background_subtraction.subtract_background_rolling_ball(image, radius, light_background=False)
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        result = []
+        seconds, _ = measure(lambda: result.append(background_subtraction.subtract_background_rolling_ball(
+            image, radius, light_background=False, workers=workers)), repeats=1, trace_memory=False)
+        identical = all(np.array_equal(a, e) for a, e in zip(result[0], expected))
+        print('  {:>2} workers {:8.2f} s, {:8.1f} Mpixel/s, identical {}'.format(
+            workers, seconds, image.size / seconds / 1e6, identical))
+
+
+def benchmark_time_budget(image: np.ndarray, radius: float = 10, budgets: tuple = (None, 2, 1, 0.5)):
+    """
+    Compares the predicted with the actual time of the rolling ball for different shrink factors and shows which
+    method is chosen for different time budgets and how much the approximated background differs from the exact one.
+    """
+    print('predicted and actual time of the rolling ball for a {} image (radius {})'.format(image.shape, radius))
+    for shrink_factor in (None, 2, 4, 8):
+        predicted = background_subtraction.predict_rolling_ball_seconds(image.shape, radius, shrink_factor)
+        seconds, _ = measure(lambda: background_subtraction._rolling_ball_background(
+            image, radius, False, shrink_factor=shrink_factor), repeats=1, trace_memory=False)
+        print('  shrink factor {:>4} predicted {:8.2f} s, actual {:8.2f} s'.format(
+            str(shrink_factor or 'auto'), predicted, seconds))
+
+    print('background subtraction with a time budget')
+    exact = None
+    for budget in budgets:
+        records = []
+        _, background = background_subtraction.subtract_background_rolling_ball(
+            image, radius, light_background=False, time_budget=budget, run_log=records)
+        if exact is None:
+            exact = background.astype(np.int64)
+        record = records[0]
+        print('  budget {:>6} s: {:<28} shrink factor {}, {:6.2f} s, mean difference {:.3f}'.format(
+            str(budget), record['method'] + ',', record['shrink_factor'], record['seconds'],
+            np.abs(background - exact).mean()))
+
+
+def benchmark_cache(image: np.ndarray, radius: float = 10):
+    """
+    Measures the time of the background subtraction and of taking it from the on-disk cache of derived arrays (as in
+    a rerun of the rollball scripts).
+    """
+    print('background subtraction of a {} image with the derived array cache (radius {})'.format(image.shape, radius))
+    with tempfile.TemporaryDirectory() as directory:
+        cache = derived_cache.DerivedCache(directory)
+        key = cache.key('synthetic', 'rolling ball', radius=radius, light_background=False)
+        results = []
+        for run in ('first run', 'rerun'):
+            seconds, _ = measure(lambda: results.append(cache.get_or_compute(key, lambda: (
+                background_subtraction.subtract_background_rolling_ball(image, radius, light_background=False)))),
+                repeats=1, trace_memory=False)
+            print('  {:<10} {:8.2f} s'.format(run, seconds))
+        print('  identical {}, {}'.format(all(np.array_equal(a, b) for a, b in zip(*results)), cache))
+
+
+if __name__ == '__main__':
+    validate(synthetic_8bit_image((120, 100)))
+    validate_paraboloid(synthetic_8bit_image((120, 100)))
+    if len(sys.argv) > 1:
+        obf = obf_support.File(sys.argv[1])
+        image = obf.stacks[0].data_as(np.uint8, order='native')
+        obf.close()
+    else:
+        image = synthetic_8bit_image((4000, 4000))
+    benchmark(image)
+    benchmark_workers(image)
+    benchmark_time_budget(image)
+    benchmark_cache(image)
@@ -0,0 +1,201 @@
+"""
+  Content addressed on-disk cache for arrays derived from OBF stacks by expensive processing steps (e.g. backgrounds
+  and background subtracted images), so that reruns of a script that only change later processing steps (e.g. the
+  contrast percentile or the colours of a merge) do not have to repeat the expensive ones. Cheap steps are better
+  recomputed, their results would only push the expensive ones out of the cache.
+
+  Documentation:
+
+      Include in your project as "from derived_cache import DerivedCache"
+
+      - Create with "cache = DerivedCache(directory, max_bytes=...)", the default directory is ~/.cache/obf_derived
+        (shared by all scripts and folders, entries are found by content, not by file name)
+      - key = cache.key(stack.digest(), 'stage name', parameter=value, ...) computes the key of the result of a
+        processing stage from the digest of the stack (see obf_support.Stack.digest, a hash of its stored bytes) and
+        all parameters of the stage (anything JSON serializable), keys of previous stages can be used instead of the
+        stack digest to chain stages
+      - cache.get(key) returns the cached array (or tuple of arrays) or None, cache.put(key, arrays) stores it
+      - cache.get_or_compute(key, function) returns the cached result or calls function() and stores its result,
+        with run_log=records the records that function appends to records (e.g. the run_log of
+        background_subtraction.subtract_background_rolling_ball) are stored with the result and appended again (with
+        "cached": true) on a hit, so e.g. a background approximated within a time budget is also logged when reused
+      - Entries are NumPy .npz files, when more than max_bytes are stored, the least recently used entries are removed
+        (the modification time of an entry is updated on every hit)
+      - Writing is atomic (temporary file and rename), several processes can share a cache directory
+      - Attributes: directory, max_bytes, hits, misses, evictions
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+import numpy as np
+
+
+class DerivedCache:
+    """
+    On-disk cache of NumPy arrays addressed by a hash of the input data and the parameters of the processing stage,
+    bounded by max_bytes with least recently used eviction.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 4 * 2**30):
+        """
+        :param directory: Cache directory (created if necessary), default is ~/.cache/obf_derived
+        :param max_bytes: Maximal size of all entries in bytes (None means no limit)
+        """
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.cache', 'obf_derived')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(digest: str, stage: str, **parameters) -> str:
+        """
+        Key of the result of a processing stage.
+
+        :param digest: Digest of the input data (e.g. stack.digest()) or the key of the stage producing the input
+        :param stage: Name of the processing stage (e.g. 'rolling ball')
+        :param parameters: All parameters that influence the result (JSON serializable)
+        :return: Hexadecimal key (40 characters)
+        """
+        description = json.dumps([digest, stage, parameters], sort_keys=True, default=str)
+        return hashlib.blake2b(description.encode(), digest_size=20).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns the cached array or tuple of arrays for a key or None if there is none.
+        """
+        return self._load(key)[0]
+
+    def _load(self, key: str) -> tuple:
+        """
+        Internal function. Returns the cached array or tuple of arrays for a key and the run log records stored with
+        it, or (None, None) if there is none.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                count = sum(name.startswith('arr_') for name in entry.files)
+                arrays = [entry['arr_{}'.format(idx)] for idx in range(count)]
+                is_tuple = bool(entry['is_tuple'])
+                run_log = json.loads(str(entry['run_log'])) if 'run_log' in entry.files else []
+            os.utime(path)  # most recently used
+        except FileNotFoundError:
+            # missing or removed in the meantime by another process
+            self.misses += 1
+            return None, None
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # damaged (e.g. truncated), removed so that the result is computed and stored again
+            _remove(path)
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return (tuple(arrays) if is_tuple else arrays[0]), run_log
+
+    def put(self, key: str, arrays, run_log: list = None):
+        """
+        Stores an array or a tuple of arrays for a key and removes the least recently used entries if the cache gets
+        larger than max_bytes.
+
+        :param run_log: Records (JSON serializable dicts) describing how the arrays were computed, stored with them
+        """
+        is_tuple = isinstance(arrays, tuple)
+        if not is_tuple:
+            arrays = (arrays,)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file, temporary_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(file, 'wb') as f:
+                np.savez(f, *arrays, is_tuple=is_tuple, run_log=json.dumps(run_log or []))
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        self._evict()
+
+    def get_or_compute(self, key: str, function, run_log: list = None):
+        """
+        Returns the cached result for a key or, if there is none, computes it with function() (returning an array or a
+        tuple of arrays) and stores it.
+
+        :param run_log: List that function appends records to, the new records are stored with the result and
+            appended again (with "cached": True) when the result is taken from the cache
+        """
+        arrays, records = self._load(key)
+        if arrays is None:
+            first = len(run_log) if run_log is not None else 0
+            arrays = function()
+            self.put(key, arrays, run_log[first:] if run_log is not None else None)
+        elif run_log is not None:
+            run_log.extend(dict(record, cached=True) for record in records)
+        return arrays
+
+    def nbytes(self) -> int:
+        """
+        Size of all entries in bytes.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        for path, _, _ in self._entries():
+            _remove(path)
+
+    def _path(self, key: str) -> str:
+        # two levels, so that directories stay small
+        return os.path.join(self.directory, key[:2], key + '.npz')
+
+    def _entries(self) -> list:
+        """
+        Internal function. All entries as (path, size, last use).
+        """
+        entries = []
+        for sub_directory in os.scandir(self.directory):
+            if not sub_directory.is_dir():
+                continue
+            for entry in os.scandir(sub_directory.path):
+                if entry.name.endswith('.npz'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        """
+        Internal function. Removes the least recently used entries until at most max_bytes are stored (always keeps the
+        most recently used entry).
+        """
+        if self.max_bytes is None:
+            return
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        nbytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries[:-1]:
+            if nbytes <= self.max_bytes:
+                break
+            _remove(path)
+            nbytes -= size
+            self.evictions += 1
+
+    def __str__(self) -> str:
+        return '{}: {} bytes (max {}), {} hits, {} misses, {} evictions'.format(
+            self.directory, self.nbytes(), self.max_bytes, self.hits, self.misses, self.evictions)
+
+
+def _remove(path: str):
+    """
+    Removes a file if it still exists (another process may have removed it already).
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -58,31 +58,24 @@ def main():
 
         # now load all the wanted stacks, turn them into numpy arrays and get the exact name.
         for stack in wanted_stacks:
-            array = stack.data  # this is where Jan does the magic of converting obf to numpy
-
-            # Dimensionnen von Imspector aus sind [T, Z, Y, X]
-            size = array.shape  # The shape attribute for numpy arrays returns the dimensions of the array. If Y has n rows and m columns, then Y.shape is (n,m). So Y.shape[0] is n
-            print('The numpy array of the channel has the following dimensions: {}'.format(size))
-
-            # wir wollen aber [X, Y, Z]
-            # 1) reduce to [Z, Y, X]
-            array = numpy.reshape(array, size[:2])  # TODO: make sure it also works for videos or stacks
-
-            # 3) just to visualize the dimensions again
-            size = array.shape
-            print('After transposing, the numpy array of the channel has the following dimensions: {}'.format(size))
-
-            array = numpy.transpose(array)  # need to transpose to have in the original orientation
-            stackname = stack.name
-            enhanced_contrast = enhance_contrast(array, stackname)
-
-            # save the tiff images unprocessed
-            a = array * 1  ## dass ich hier das Array duplizieren muss und mal 1 nehmen, ist vollkommener Bullshit, aber auf dem originalen Array lässt er mich nicht rummanipulieren... :/
-            a[a > 255] = 255
-            save_array_with_pillow(a, result_path, filename, stackname)
-
-            #save the contrast enhanced images
-            save_array_with_pillow(enhanced_contrast, result_path, filename, stackname + "contr-enh")
+            # Dimensionnen von Imspector aus sind [X, Y, Z, T]
+            print('The channel has the following dimensions: {}'.format(stack.shape))
+
+            # videos and z-stacks are saved plane by plane, only one XY plane is in memory at a time
+            number_of_planes = int(numpy.prod(stack.shape[2:]))
+            for index, array in stack.iter_planes(order='native'):  # this is where Jan does the magic of converting obf to numpy, already in the original orientation [Y, X]
+                stackname = stack.name
+                if number_of_planes > 1:
+                    stackname += "_" + "_".join(str(i) for i in index)  # index of the plane in [Z, T]
+                enhanced_contrast = enhance_contrast(array, stackname)
+
+                # save the tiff images unprocessed
+                a = array * 1  ## dass ich hier das Array duplizieren muss und mal 1 nehmen, ist vollkommener Bullshit, aber auf dem originalen Array lässt er mich nicht rummanipulieren... :/
+                a[a > 255] = 255
+                save_array_with_pillow(a, result_path, filename, stackname)
+
+                #save the contrast enhanced images
+                save_array_with_pillow(enhanced_contrast, result_path, filename, stackname + "contr-enh")
             #
             # #save an image which was just contrast enhanced by multiplying with 2
             # if "Bax" in stackname:
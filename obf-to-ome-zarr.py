@@ -0,0 +1,66 @@
+'''
+
+Opens .obf files and saves every stack as OME-Zarr image (with a multiscale pyramid, e.g. for napari or web viewers).
+
+The stacks are read plane by plane and the chunks are compressed and written in parallel (write_ome_zarr in
+obf_export.py), so even stacks larger than the memory can be converted. The full bit depth and the pixel sizes are kept.
+
+The OBF file format originates from the Department of NanoBiophotonics
+of the Max Planck Institute for Biophysical Chemistry in Göttingen, Germany. A specification can be found at
+https://github.com/AbberiorInstruments/ImspectorDocs/blob/master/docs/fileformat.rst
+
+Opening and converting to numpy array is done via the obf support package by Jan Keller-Findeisen (https://github.com/jkfindeisen)
+https://github.com/jkfindeisen/python-mix/tree/main/obf
+
+Include Jan's obf_support.py and obf_export.py in your project and import them into the code with "import obf_support".
+'''
+
+
+import obf_support
+import obf_export
+from tkinter import filedialog
+import os
+
+
+def main():
+    # let the user choose the folder containing the images to be converted
+    root_path = filedialog.askdirectory()  # prompts user to choose directory. From tkinter
+
+    # prints out the number of files in the selected folder with the .obf file format
+    file_format = ".obf"
+    filenames = [filename for filename in sorted(os.listdir(root_path)) if filename.endswith(file_format)]
+    print("There are {} files with this format.".format(len(filenames)))
+    if not filenames:  # pythonic for if a list is empty
+        print("There are no files with this format.")
+
+    namepart = ""
+
+    # create a subfolder where the converted images would be saved
+    result_path = os.path.join(root_path, 'ome-zarr')
+    if not os.path.isdir(result_path):
+        os.makedirs(result_path)
+
+    # go through the list of files
+    for filename in filenames:
+        print(filename)
+        file_path = os.path.join(root_path, filename)
+        current_obf_file = obf_support.File(file_path) #this is where Jan does the magic of opening
+
+        #extract the stacks according o the defined name part
+        wanted_stacks = [stack for stack in current_obf_file.stacks if namepart in stack.name and stack.dimensionality >= 2]
+        print('The measurement contains {} {} channels.'.format(len(wanted_stacks), namepart))
+
+        for stack in wanted_stacks:
+            stackname = stack.name
+            print('{} has the dimensions {}'.format(stackname, stack.shape))
+            output_path = os.path.join(result_path, filename[:-4] + "_" + stackname + '.ome.zarr')
+            try:
+                obf_export.write_ome_zarr(stack, output_path)
+            except ValueError as error:  # e.g. more than three spatial dimensions
+                print(error)
+
+        current_obf_file.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -60,14 +60,14 @@ def main():
 
         # now load all the wanted stacks, turn them into numpy arrays and get the exact name.
         for stack in wanted_stacks:
-            array = stack.data  # this is where Jan does the magic of converting obf to numpy
-            array = numpy.transpose(array)  # need to transpose to have in the original orientation
             stackname = stack.name
 
 
+            array = stack.as_array(order='native')  # this is where Jan does the magic of converting obf to numpy, already in the original orientation
+            # (data_as below converts the loaded data, the stack is inflated only once)
+
             # save the tiff images unprocessed
-            a = array * 1  ## dass ich hier das Array duplizieren muss und mal 1 nehmen, ist vollkommener Bullshit, aber auf dem originalen Array lässt er mich nicht rummanipulieren... :/
-            a[a > 255] = 255
+            a = stack.data_as(numpy.uint8, order='native')  # converted to 8 bit directly, values above 255 are set to 255
             save_array_with_pillow(a, result_path, filename, stackname)
 
             #save the contrast enhanced images - ACTIVATE IF WANTED!!
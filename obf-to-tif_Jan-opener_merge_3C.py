@@ -52,21 +52,27 @@ def main():
         #extract the stacks according o the defined name part
         wanted_stacks = [stack for stack in current_obf_file.stacks if namepart in stack.name]
         print('The measurement contains {} {} channels.'.format(len(wanted_stacks), namepart))
+        current_obf_file.load_stacks([stack for stack in wanted_stacks if any(channel in stack.name for channel in ('Bax', 'BaK', 'Tom'))])  # loads (and decompresses) the processed channels at the same time
 
         # alternatively take all stacks from the measurement with the following line:
         # for stack in current_obf_file.stacks:
 
         # now load all the wanted stacks, turn them into numpy arrays and get the exact name.
         for stack in wanted_stacks:
-            array = stack.data  # this is where Jan does the magic of converting obf to numpy
-            array = numpy.transpose(array)  # need to transpose to have in the original orientation
             stackname = stack.name
             print(stackname)
 
+            # the full precision data is only loaded (once) for the channels that are processed further, data_as converts
+            # the loaded data then, all other stacks are converted to 8 bit block by block without loading them
+            processed = any(channel in stackname for channel in ('Bax', 'BaK', 'Tom'))
+            if processed:
+                array = stack.as_array(order='native')  # this is where Jan does the magic of converting obf to numpy, already in the original orientation
+
             #save the tiff images unprocessed
-            a = array * 1  ## dass ich hier das Array duplizieren muss und mal 1 nehmen, ist vollkommener Bullshit, aber auf dem originalen Array lässt er mich nicht rummanipulieren... :/
-            a[a>255] = 255
+            a = stack.data_as(numpy.uint8, order='native')  # converted to 8 bit directly, values above 255 are set to 255
             save_array_with_pillow(a, result_path, filename, stackname)
+            if not processed:
+                continue  # only saved as 8 bit
 
             if "Bax" in stackname:
                 Bax_enhanced = enhance_contrast(array, stackname)
@@ -0,0 +1,85 @@
+'''
+
+Opens .obf files and saves projections (maximum intensity, mean, sum, standard deviation) of z-stacks and time series as .tiffs.
+
+All projections of a stack are computed in a single pass over its XY planes (Stack.project in obf_support.py), so only
+one plane and the projections themselves are held in memory, no matter how many planes the stack has.
+
+The OBF file format originates from the Department of NanoBiophotonics
+of the Max Planck Institute for Biophysical Chemistry in Göttingen, Germany. A specification can be found at
+https://github.com/AbberiorInstruments/ImspectorDocs/blob/master/docs/fileformat.rst
+
+Opening and converting to numpy array is done via the obf support package by Jan Keller-Findeisen (https://github.com/jkfindeisen)
+https://github.com/jkfindeisen/python-mix/tree/main/obf
+
+Include Jan's obf_support.py in your project and import it into the code with "import obf_support".
+'''
+
+
+from utils import *  # need the utils.py file which has auxiliary funcs
+import obf_support
+from tkinter import filedialog
+import os
+import numpy
+from PIL import Image
+
+
+def main():
+    # let the user choose the folder containing the images to be converted
+    root_path = filedialog.askdirectory()  # prompts user to choose directory. From tkinter
+
+    # prints out the number of files in the selected folder with the .obf file format
+    file_format = ".obf"
+    filenames = [filename for filename in sorted(os.listdir(root_path)) if filename.endswith(file_format)]
+    print("There are {} files with this format.".format(len(filenames)))
+    if not filenames:  # pythonic for if a list is empty
+        print("There are no files with this format.")
+
+    namepart = ""
+    # which projections to save, all of them are computed in one pass over the planes
+    projections = ('max', 'mean', 'sum', 'std')
+
+    # create a subfolder where the converted images would be saved
+    result_path = os.path.join(root_path, 'projections')
+    if not os.path.isdir(result_path):
+        os.makedirs(result_path)
+
+    # go through the list of files
+    for filename in filenames:
+        print(filename)
+        file_path = os.path.join(root_path, filename)
+        current_obf_file = obf_support.File(file_path) #this is where Jan does the magic of opening
+
+        #extract the stacks according o the defined name part, only stacks with more than one XY plane can be projected
+        wanted_stacks = [stack for stack in current_obf_file.stacks if namepart in stack.name and stack.dimensionality > 2]
+        print('The measurement contains {} {} z-stacks or time series.'.format(len(wanted_stacks), namepart))
+
+        for stack in wanted_stacks:
+            stackname = stack.name
+            print('{} has the dimensions {}'.format(stackname, stack.shape))
+
+            # projections along Z (and T) in the original orientation [Y, X]
+            projected = stack.project(projections, order='native')
+            for kind, array in projected.items():
+                # save the projection unprocessed (values above 255 are set to 255)
+                a = numpy.clip(array, 0, 255)
+                save_array_with_pillow(a, result_path, filename, stackname + "-" + kind)
+
+                # save the contrast enhanced projection (sum and std are usually not in the 8-bit range)
+                enhanced_contrast, percentile = enhance_contrast(array)
+                save_array_with_pillow(enhanced_contrast, result_path, filename, stackname + "-" + kind + "-enh" + str(percentile))
+
+        current_obf_file.close()
+
+
+def save_array_with_pillow(array, result_path, filename, stackname):
+    # The type of the numpy array needs to be unsigned integer, otherwise can't be saved as tiff.
+    # unit8 = Unsigned integer (0 to 255); unit32 = Unsigned integer (0 to 4294967295)
+    eight_bit_array = array.astype(numpy.uint8)
+    output_file = os.path.join(result_path, filename[:-4] + "_" + stackname + '.tiff')
+    img = Image.fromarray(eight_bit_array)
+    img.save(output_file, format='tiff')
+
+
+if __name__ == '__main__':
+    main()
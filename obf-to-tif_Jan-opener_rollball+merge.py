@@ -24,7 +24,8 @@ from tkinter import filedialog
 import os
 import numpy
 from PIL import Image
-from cv2_rolling_ball import subtract_background_rolling_ball
+from background_subtraction import subtract_background_rolling_ball, write_run_log  # fast NumPy version of cv2_rolling_ball (same results)
+from derived_cache import DerivedCache  # on-disk cache of background subtractions
 
 
 def main():
@@ -41,10 +42,20 @@ def main():
     # ask user which part in the name we are looking for:
     namepart = input("Please enter the namepart you are looking for - case-sensitive (eg STED, Confocal..). If all stacks are wanted press enter: ")
 
+    # background subtraction with a rolling ball (False) or a sliding paraboloid (True, takes the same time for every radius)
+    use_paraboloid = False
+    # seconds the background subtraction of one image may take, a faster approximation is used if it would take longer
+    # (the decisions are written to run_log.jsonl in the result folder), None for no limit
+    time_budget = 300
+    # background subtractions are cached (in ~/.cache/obf_derived, at most 4 GB) by the content of the stack and all
+    # parameters, so a rerun that only changes later steps (e.g. the merge) skips them
+    cache = DerivedCache(max_bytes=4 * 2**30)
+
     # create a subfolder where the converted images would be saved
     result_path = os.path.join(root_path, 'tifs')
     if not os.path.isdir(result_path):
         os.makedirs(result_path)
+    run_log_path = os.path.join(result_path, 'run_log.jsonl')
 
     # go through the list of files
     for filename in filenames:
@@ -61,19 +72,27 @@ def main():
 
         # now load all the wanted stacks, turn them into numpy arrays and get the exact name.
         for stack in wanted_stacks:
-            array = stack.data  # this is where Jan does the magic of converting obf to numpy
-            array = numpy.transpose(array)  # need to transpose to have in the original orientation
             stackname = stack.name
 
+            # the full precision data is only loaded (once) for the channels that are processed further, data_as converts
+            # the loaded data then, all other stacks are converted to 8 bit block by block without loading them
+            processed = any(channel in stackname for channel in ('Bax', 'Tom'))
+            if processed:
+                array = stack.as_array(order='native')  # this is where Jan does the magic of converting obf to numpy, already in the original orientation
+
             # save the tiff images unprocessed
-            a = array * 1  ## dass ich hier das Array duplizieren muss und mal 1 nehmen, ist vollkommener Bullshit, aber auf dem originalen Array lässt er mich nicht rummanipulieren... :/
-            a[a>255] = 255  # um komische Artefakte zu verhindern, falls Nummern über 255 entstehen beim stretchen
+            a = stack.data_as(numpy.uint8, order='native')  # converted to 8 bit directly, values above 255 are set to 255
             save_array_with_pillow(a, result_path, filename, stackname)
+            if not processed:
+                continue  # only saved as 8 bit
 
             if "Bax" in stackname:
                 # background subtraction by rolling ball algorithm with 3x3 mean filter (=presmooth) and ball as structuring element
-                # ATTENTION: This takes forever (like 2 hours for one 60x60µm image), so if you just want to try the code, use the file without the rolling ball thing!!
-                img, background = subtract_background_rolling_ball(array.astype(numpy.uint8), 10, light_background=False, use_paraboloid=False, do_presmooth=True)
+                # takes a few seconds for one 60x60µm image (it took about 2 hours with cv2_rolling_ball)
+                key = cache.key(stack.digest(), 'rolling ball', input='uint8', radius=10, light_background=False, use_paraboloid=use_paraboloid, do_presmooth=True, time_budget=time_budget)
+                records = []  # also gets the records of a cached background (marked as cached)
+                img, background = cache.get_or_compute(key, lambda: subtract_background_rolling_ball(array.astype(numpy.uint8), 10, light_background=False, use_paraboloid=use_paraboloid, do_presmooth=True, workers=os.cpu_count(), time_budget=time_budget, run_log=records), run_log=records)
+                write_run_log(run_log_path, [dict(record, file=filename, stack=stackname) for record in records])
                 save_array_with_pillow(img, result_path, filename, stackname + "img_without_background")
                 save_array_with_pillow(background, result_path, filename, stackname + "background")
                 # enhance contrast
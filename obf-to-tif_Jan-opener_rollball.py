@@ -22,7 +22,8 @@ from tkinter import filedialog
 import os
 import numpy
 from PIL import Image
-from cv2_rolling_ball import subtract_background_rolling_ball
+from background_subtraction import subtract_background_rolling_ball, write_run_log  # fast NumPy version of cv2_rolling_ball (same results)
+from derived_cache import DerivedCache  # on-disk cache of background subtractions
 from scipy import ndimage
 
 
@@ -40,10 +41,20 @@ def main():
     # ask user which what part in the name we are looking for:
     namepart = input("Please enter the namepart you are looking for - case-sensitive (eg STED, Confocal..). If all stacks are wanted press enter: ")
 
+    # background subtraction with a rolling ball (False) or a sliding paraboloid (True, takes the same time for every radius)
+    use_paraboloid = False
+    # seconds the background subtraction of one image may take, a faster approximation is used if it would take longer
+    # (the decisions are written to run_log.jsonl in the result folder), None for no limit
+    time_budget = 300
+    # background subtractions are cached (in ~/.cache/obf_derived, at most 4 GB) by the content of the stack and all
+    # parameters, so a rerun that only changes later steps (e.g. the contrast enhancement) skips them
+    cache = DerivedCache(max_bytes=4 * 2**30)
+
     # create a subfolder where the converted images would be saved
     result_path = os.path.join(root_path, 'tifs')
     if not os.path.isdir(result_path):
         os.makedirs(result_path)
+    run_log_path = os.path.join(result_path, 'run_log.jsonl')
 
     # go through the list of files
     for filename in filenames:
@@ -60,8 +71,7 @@ def main():
 
         # now load all the wanted stacks, turn them into numpy arrays and get the exact name.
         for stack in wanted_stacks:
-            array = stack.data  # this is where Jan does the magic of converting obf to numpy
-            array = numpy.transpose(array)  # need to transpose to have in the original orientation
+            array = stack.as_array(order='native')  # this is where Jan does the magic of converting obf to numpy, already in the original orientation
             stackname = stack.name
 
             #save the tiff images unprocessed
@@ -75,7 +85,10 @@ def main():
             # save_array_with_pillow(mean_array, result_path, filename, stackname + "mean")
 
             # background subtraction
-            img, background = subtract_background_rolling_ball(array.astype(numpy.uint8), 10, light_background=False, use_paraboloid=False, do_presmooth=True)  ##TODO: try paraboiloid false
+            key = cache.key(stack.digest(), 'rolling ball', input='uint8', radius=10, light_background=False, use_paraboloid=use_paraboloid, do_presmooth=True, time_budget=time_budget)
+            records = []  # also gets the records of a cached background (marked as cached)
+            img, background = cache.get_or_compute(key, lambda: subtract_background_rolling_ball(array.astype(numpy.uint8), 10, light_background=False, use_paraboloid=use_paraboloid, do_presmooth=True, workers=os.cpu_count(), time_budget=time_budget, run_log=records), run_log=records)
+            write_run_log(run_log_path, [dict(record, file=filename, stack=stackname) for record in records])
 
             save_array_with_pillow(img, result_path, filename, stackname + "img_without_background")
             save_array_with_pillow(background, result_path, filename, stackname + "background")
@@ -0,0 +1,313 @@
+"""
+  Export of stacks of OBF/MSR files (read with obf_support.py) to other file formats. Depends on NumPy (and tifffile
+  for OME-TIFF).
+
+  Documentation:
+
+      Include in your project as "import obf_export"
+
+      OME-Zarr
+      - "obf_export.write_ome_zarr(stack, path)" writes a stack as OME-Zarr image (version 0.4,
+        https://ngff.openmicroscopy.org/0.4/) into a local directory (Zarr version 2 directory store with zlib
+        compressed chunks), including a multiscale pyramid of 2x2 mean downsampled XY planes and the physical pixel
+        sizes and units of the stack
+      - "obf_export.write_ome_zarr([stack1, stack2], path)" writes several stacks of the same shape and data type as
+        channels of one image
+      - The stack is read plane by plane (see Stack.iter_planes), the chunks are compressed and written on a thread pool
+        (zlib releases the GIL), so only a few planes are held in memory at a time
+      - The dimensions of a stack are [X, Y, Z, T] (see Stack.data), in OME-Zarr they are stored in reversed order
+        [T, C, Z, Y, X], the XY chunk size and the number of pyramid levels can be chosen
+
+      OME-TIFF (requires tifffile, zstd and lzw compression require imagecodecs)
+      - "obf_export.write_ome_tiff(stack, path)" writes a stack as tiled OME-TIFF (BigTIFF if needed) with zlib
+        (deflate) compression, keeping the data type of the stack and the physical pixel sizes and units
+      - "obf_export.write_ome_tiff([stack1, stack2], path)" writes several stacks of the same shape as channels of one
+        image, all planes (Z, T) are stored in the same file
+      - "obf_export.write_ome_tiff(stack, path, dtype=numpy.uint8)" converts the data while writing (values outside
+        of the range of an integer data type are clipped)
+      - The stack is read plane by plane and the tiles are compressed on a thread pool (by tifffile), the compression
+        ('zlib', 'zstd', 'lzw' or None), compression level and tile size can be chosen
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import math
+import os
+import zlib
+import numpy as np
+import obf_support
+
+# version of the OME-Zarr specification that is written
+OME_ZARR_VERSION = '0.4'
+
+# OME-TIFF unit symbols of the OME-Zarr units
+ome_tiff_units = {'meter': 'm', 'millimeter': 'mm', 'micrometer': '\u00b5m', 'nanometer': 'nm', 'second': 's',
+                  'millisecond': 'ms', 'microsecond': '\u00b5s', 'nanosecond': 'ns', 'minute': 'min', 'hour': 'h'}
+
+# OME-Zarr units of length and time by their factor relative to the SI base unit
+length_units = {1: 'meter', 1e-3: 'millimeter', 1e-6: 'micrometer', 1e-9: 'nanometer'}
+time_units = {1: 'second', 1e-3: 'millisecond', 1e-6: 'microsecond', 1e-9: 'nanosecond', 60: 'minute', 3600: 'hour'}
+
+
+def write_ome_zarr(stacks, path: str, chunks: tuple = (1024, 1024), levels: int = None, compression_level: int = 1,
+                   workers: int = None):
+    """
+    Writes one or more stacks as OME-Zarr image (multiscale pyramid, version 0.4) into a local directory.
+
+    :param stacks: A Stack or a list of Stacks with the same shape and data type (stored as channels)
+    :param path: Directory of the image (e.g. 'image.ome.zarr'), existing array files in it are overwritten
+    :param chunks: Chunk size in Y and X (all other dimensions have chunk size 1)
+    :param levels: Number of resolution levels (each downsampled by 2 in X and Y), default is as many as needed until
+        an XY plane fits into a single chunk
+    :param compression_level: zlib compression level of the chunks (0-9)
+    :param workers: Number of threads compressing and writing chunks, default is the number of CPUs
+    """
+    if isinstance(stacks, obf_support.Stack):
+        stacks = [stacks]
+    stack = stacks[0]
+    if any(other.shape != stack.shape or other.data_type != stack.data_type for other in stacks[1:]):
+        raise ValueError('All stacks must have the same shape and data type.')
+    dimensionality = stack.dimensionality
+    if dimensionality < 2:
+        raise ValueError('Stack {} has less than two dimensions.'.format(stack.name))
+    axes = _axes(stack, dimensionality, len(stacks) > 1)
+
+    # shape of the full resolution level (X and Y last) and of the downsampled levels
+    shape = list(stack.shape[:dimensionality][::-1])
+    if len(stacks) > 1:
+        shape.insert(1 if axes[0]['type'] == 'time' else 0, len(stacks))
+    if levels is None:
+        levels = 1
+        while max(math.ceil(n / 2 ** (levels - 1)) for n in shape[-2:]) > max(chunks):
+            levels += 1
+    level_shapes = [shape[:-2] + [math.ceil(n / 2 ** level) for n in shape[-2:]] for level in range(levels)]
+    chunk_shape = [1] * (len(shape) - 2) + [min(chunks[0], shape[-2]), min(chunks[1], shape[-1])]
+
+    # group and multiscales meta data
+    os.makedirs(path, exist_ok=True)
+    _write_json(os.path.join(path, '.zgroup'), {'zarr_format': 2})
+    scales = _scales(stack, dimensionality, axes)
+    datasets = [{'path': str(level), 'coordinateTransformations': [
+        {'type': 'scale', 'scale': scales[:-2] + [scale * 2 ** level for scale in scales[-2:]]}]}
+        for level in range(levels)]
+    _write_json(os.path.join(path, '.zattrs'), {
+        'multiscales': [{'version': OME_ZARR_VERSION, 'name': ', '.join(stack.name for stack in stacks),
+                         'axes': axes, 'datasets': datasets, 'type': 'mean'}]})
+    dtype = np.dtype(stack.data_type)
+    for level in range(levels):
+        os.makedirs(os.path.join(path, str(level)), exist_ok=True)
+        _write_json(os.path.join(path, str(level), '.zarray'), {
+            'zarr_format': 2, 'shape': level_shapes[level], 'chunks': chunk_shape, 'dtype': dtype.str,
+            'compressor': {'id': 'zlib', 'level': compression_level}, 'fill_value': 0, 'order': 'C',
+            'filters': None, 'dimension_separator': '/'})
+
+    # write the chunks of all planes of all levels
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = deque()
+        for channel, stack in enumerate(stacks):
+            for index, plane in stack.iter_planes(order='native'):
+                # position of the plane in the dimensions before Y and X
+                position = list(index[:dimensionality - 2][::-1])
+                if len(stacks) > 1:
+                    position.insert(1 if axes[0]['type'] == 'time' else 0, channel)
+                for level in range(levels):
+                    if level > 0:
+                        plane = _downsample(plane)
+                    for y in range(0, plane.shape[0], chunk_shape[-2]):
+                        for x in range(0, plane.shape[1], chunk_shape[-1]):
+                            block = plane[y:y + chunk_shape[-2], x:x + chunk_shape[-1]]
+                            key = position + [y // chunk_shape[-2], x // chunk_shape[-1]]
+                            chunk_path = os.path.join(path, str(level), *[str(i) for i in key])
+                            futures.append(executor.submit(_write_chunk, chunk_path, block, chunk_shape[-2:],
+                                                           compression_level))
+                            if len(futures) >= 4 * workers:
+                                futures.popleft().result()
+        for future in futures:
+            future.result()
+
+
+def write_ome_tiff(stacks, path: str, tile: tuple = (256, 256), compression: str = 'zlib', compression_level: int = None,
+                   dtype=None, workers: int = None, bigtiff: bool = None):
+    """
+    Writes one or more stacks as tiled OME-TIFF file with all planes (and channels) in one file.
+
+    :param stacks: A Stack or a list of Stacks with the same shape and data type (stored as channels)
+    :param path: File path (e.g. 'image.ome.tif'), an existing file is overwritten
+    :param tile: Tile size in Y and X (multiples of 16)
+    :param compression: 'zlib' (deflate), 'zstd', 'lzw' or None (zstd and lzw require imagecodecs)
+    :param compression_level: Compression level (default of the codec if None)
+    :param dtype: Data type of the written image, default is the data type of the stacks (integer data is clipped to
+        the range of the data type)
+    :param workers: Number of threads compressing tiles, default is chosen by tifffile
+    :param bigtiff: Write a BigTIFF file, default is True if the uncompressed data is larger than 2 GB
+    """
+    import tifffile
+
+    if isinstance(stacks, obf_support.Stack):
+        stacks = [stacks]
+    stack = stacks[0]
+    if any(other.shape != stack.shape or other.data_type != stack.data_type for other in stacks[1:]):
+        raise ValueError('All stacks must have the same shape and data type.')
+    dimensionality = stack.dimensionality
+    if dimensionality < 2:
+        raise ValueError('Stack {} has less than two dimensions.'.format(stack.name))
+    axes = _axes(stack, dimensionality, len(stacks) > 1)
+    scales = _scales(stack, dimensionality, axes)
+
+    # shape of the image (X and Y last), the planes of all stacks are interleaved in the order of the image
+    shape = list(stack.shape[:dimensionality][::-1])
+    if len(stacks) > 1:
+        shape.insert(1 if axes[0]['type'] == 'time' else 0, len(stacks))
+    dtype = np.dtype(dtype or stack.data_type)
+    if bigtiff is None:
+        bigtiff = int(np.prod(shape)) * dtype.itemsize > 2 ** 31
+    time_points = shape[0] if len(stacks) > 1 and axes[0]['type'] == 'time' else 1
+    planes_per_channel = int(np.prod(shape[:-2])) // len(stacks) // time_points
+
+    metadata = {'axes': ''.join(axis['name'].upper() for axis in axes), 'Name': ', '.join(stack.name for stack in stacks)}
+    if len(stacks) > 1:
+        metadata['Channel'] = {'Name': [stack.name for stack in stacks]}
+    for axis, scale in zip(axes, scales):
+        if axis['type'] == 'space':
+            metadata['PhysicalSize' + axis['name'].upper()] = scale
+            metadata['PhysicalSize' + axis['name'].upper() + 'Unit'] = ome_tiff_units[axis['unit']]
+        elif axis['type'] == 'time':
+            metadata['TimeIncrement'] = scale
+            metadata['TimeIncrementUnit'] = ome_tiff_units[axis['unit']]
+
+    def tiles():
+        planes = [stack.iter_planes(order='native') for stack in stacks]
+        for _ in range(time_points):
+            for channel_planes in planes:
+                for _, plane in itertools.islice(channel_planes, planes_per_channel):
+                    plane = _as_dtype(plane, dtype)
+                    for y in range(0, plane.shape[0], tile[0]):
+                        for x in range(0, plane.shape[1], tile[1]):
+                            yield plane[y:y + tile[0], x:x + tile[1]]
+
+    compressionargs = {'level': compression_level} if compression and compression_level is not None else None
+    tifffile.imwrite(path, tiles(), shape=tuple(shape), dtype=dtype, tile=tuple(tile), compression=compression,
+                     compressionargs=compressionargs, maxworkers=workers, photometric='minisblack', bigtiff=bigtiff,
+                     metadata=metadata, ome=True)
+
+
+def _axes(stack, dimensionality: int, channels: bool) -> list:
+    """
+    For internal use only. OME-Zarr axes of a stack (in reversed order of the dimensions of the stack), the type of
+    every dimension is taken from its SI unit (meter: space, second: time), dimensions without unit are space for the
+    first three dimensions and time otherwise.
+    """
+    names = []
+    types = []
+    units = []
+    spatial_names = iter(('x', 'y', 'z'))
+    for dimension in range(dimensionality):
+        unit = _unit(stack, dimension)
+        if unit in time_units.values() or (unit is None and dimension >= 3):
+            names.append('t')
+            types.append('time')
+            units.append(unit or 'second')
+        else:
+            names.append(next(spatial_names, 'space{}'.format(dimension)))
+            types.append('space')
+            units.append(unit or 'micrometer')
+    axes = [{'name': name, 'type': axis_type, 'unit': unit}
+            for name, axis_type, unit in zip(names[::-1], types[::-1], units[::-1])]
+    if channels:
+        axes.insert(1 if axes[0]['type'] == 'time' else 0, {'name': 'c', 'type': 'channel'})
+
+    # OME-Zarr allows (in this order) an optional time axis, an optional channel axis and two or three space axes
+    axis_types = [axis['type'] for axis in axes]
+    while axis_types and axis_types[0] in ('time', 'channel') and axis_types.count(axis_types[0]) == 1:
+        axis_types.pop(0)
+    if axis_types not in (['space', 'space'], ['space', 'space', 'space']) or len(axes) > 5:
+        raise ValueError('The dimensions {} of stack {} cannot be stored as OME image.'.format(
+            [axis['name'] for axis in axes], stack.name))
+    return axes
+
+
+def _unit(stack, dimension: int) -> str:
+    """
+    For internal use only. OME-Zarr unit of a dimension of a stack (from its SI unit, None if unknown).
+    """
+    si_dimensions = stack.si_dimensions
+    if si_dimensions is None or dimension >= len(si_dimensions):
+        return None
+    unit = si_dimensions[dimension]
+    exponents = [exponent.numerator for exponent in unit.exponents]
+    for base, units in ((0, length_units), (2, time_units)):
+        if exponents[base] == 1 and sum(1 for exponent in exponents if exponent != 0) == 1:
+            factor = min(units, key=lambda factor: abs(math.log(factor / unit.scalefactor))) \
+                if unit.scalefactor > 0 else 1
+            return units[factor]
+    return None
+
+
+def _scales(stack, dimensionality: int, axes: list) -> list:
+    """
+    For internal use only. Pixel sizes of the full resolution level in the units of the axes.
+    """
+    factors = {name: factor for units in (length_units, time_units) for factor, name in units.items()}
+    pixel_sizes = [size for size in stack.pixel_sizes[:dimensionality][::-1]]
+    scales = []
+    for axis in axes:
+        if axis['type'] == 'channel':
+            scales.append(1.0)
+            continue
+        size = pixel_sizes.pop(0) / factors[axis['unit']]
+        scales.append(size if math.isfinite(size) and size > 0 else 1.0)
+    return scales
+
+
+def _downsample(plane: np.ndarray) -> np.ndarray:
+    """
+    For internal use only. Halves both dimensions of a plane by averaging 2x2 blocks (odd sizes are padded by
+    repeating the last row or column), integer data is rounded.
+    """
+    height, width = plane.shape
+    if height % 2 or width % 2:
+        plane = np.pad(plane, ((0, height % 2), (0, width % 2)), mode='edge')
+    blocks = plane.reshape(plane.shape[0] // 2, 2, plane.shape[1] // 2, 2)
+    mean = blocks.mean(axis=(1, 3))
+    if np.issubdtype(plane.dtype, np.integer):
+        mean = np.rint(mean)
+    return mean.astype(plane.dtype)
+
+
+def _as_dtype(plane: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """
+    For internal use only. Converts a plane to a data type, values outside of the range of an integer data type are
+    clipped.
+    """
+    if plane.dtype == dtype:
+        return plane
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        plane = np.clip(plane, info.min, info.max)
+    return plane.astype(dtype)
+
+
+def _write_chunk(chunk_path: str, block: np.ndarray, chunk_shape: list, compression_level: int):
+    """
+    For internal use only. Compresses and writes a chunk, chunks at the borders are padded with the fill value (0) to
+    the full chunk size as required by Zarr.
+    """
+    if block.shape != tuple(chunk_shape):
+        padded = np.zeros(chunk_shape, dtype=block.dtype)
+        padded[:block.shape[0], :block.shape[1]] = block
+        block = padded
+    data = zlib.compress(np.ascontiguousarray(block).tobytes(), compression_level)
+    os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+    with open(chunk_path, 'wb') as file:
+        file.write(data)
+
+
+def _write_json(file_path: str, content: dict):
+    """
+    For internal use only.
+    """
+    with open(file_path, 'w') as file:
+        json.dump(content, file, indent=2)
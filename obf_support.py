@@ -10,13 +10,51 @@
 
       File
       - Open an OBF file with "obf = obf_support.File(path_to_file)", that will read all meta data (including stack meta data)
+      - Stack footers (labels, metadata, tag dictionary, ...) are read immediately, "obf_support.File(path_to_file,
+        lazy=True)" reads them only when they are accessed the first time (the default if a stack_filter is given),
+        lazily read footers of stacks that were not accessed are no longer available after closing the file
+      - "obf_support.File(path_to_file, use_index=True)" stores the meta data of all stacks in a small index file next to
+        the file and takes it from there the next time (as long as file size and modification time are unchanged)
+      - "obf_support.File(path_to_file, stack_filter=name_part)" only keeps stacks whose name contains name_part (the
+        footers of all other stacks are never read)
+      - Uncompressed stacks are memory mapped by default, use "obf_support.File(path_to_file, memory_map=False)" to
+        read them into memory instead
+      - Stack data is streamed (read and inflated block by block into the final array), "streaming=False" reads and
+        inflates all bytes of a stack at once (needs more memory, mostly for comparison)
       - Access the following attributes: format_version, description, stacks
+      - stack_table is a NumPy structured array of the stack headers (name, rank, shape, lengths, offsets, data_type, ...)
+        for selecting stacks by shape, data type or name with vectorized queries instead of loops over the stacks
+      - Load several stacks at once with "obf.load_stacks(stacks, workers=N)", the data of different stacks can also be
+        accessed from different threads at the same time
       - Close with "obf.close()" (optional, is also closed automatically on deletion of the File object)
 
       Stack
       - Each Stack has attributes: format_version, name, description, shape, lengths, offsets, data_type, data
       - data returns a NumPy array containing the stack data (the stack data is loaded from the file lazily, i.e. when the
-        attribute is accessed the first time)
+        attribute is accessed the first time), for uncompressed stacks that are stored contiguously this is a read-only
+        view on a NumPy memmap (nothing is read until the pixels are actually accessed)
+      - as_array(order='native') returns the data in the order in which it is stored (e.g. [T, Z, Y, X], C-contiguous),
+        which is the same as numpy.transpose(data) and the orientation of images in Imspector
+      - data_as(dtype, scale=..., offset=..., clip=..., lut=...) returns the data converted to another data type (by
+        default saturating, i.e. values above 255 become 255 for uint8), if the data isn't loaded, it is converted block
+        by block while inflating, so the data in its original data type is never held in memory as a whole
+      - load(workers=N) (re-)loads the data, compressed stacks with flush points are inflated on N threads
+      - load(out=buffer) decodes the data into a caller supplied buffer, load(scratch_dir=path) or
+        "obf_support.File(path_to_file, scratch_dir=path)" decode it into a memory mapped temporary file, for stacks
+        that are larger than the available memory
+      - digest() returns a hash of the stored (compressed) bytes, shape and data type of the stack without inflating
+        anything, e.g. as key for caching results computed from the data (see derived_cache.py)
+      - release() releases the loaded data (it is loaded again on the next access), loaded data of all stacks is
+        tracked by obf_support.data_cache, which releases the least recently used data when more than
+        obf_support.data_cache.max_bytes are loaded (no limit by default)
+      - iter_planes(axis=2) yields (index, plane) for all XY planes (or the sub-stacks of all dimensions before axis)
+        in the order in which they are stored, inflating only one plane at a time if the data isn't loaded
+      - project(('max', 'mean', ...), axis=2) computes several projections (max, min, sum, mean, std) along all
+        dimensions from axis on in a single pass over the planes
+      - as_lazy_array() returns a lazy, chunked array (one chunk per plane), which reads only what is indexed and can
+        be wrapped by dask with "dask.array.from_array(lazy, chunks=lazy.chunks)"
+      - read(index) or stack[index] returns part of the data (same as data[index]) and reads only the planes covering
+        the index, starting at the nearest flush point of compressed stacks
 
   Example: see obf_support_example.py
 
@@ -24,12 +62,14 @@
 
       - Relies on the struct module (https://docs.python.org/3.9/library/struct.html).
       - In particular see the format characters of the struct module (https://docs.python.org/3.9/library/struct.html#format-characters).
+      - Stack headers and footers are decoded with the struct module, the formats are derived from the record layouts
+        stack_header_dtype and stack_footer_dtype() (which the stack_table and the synthetic files of the benchmark
+        also use), see stack_footer_layout().
       - Opened issue at https://github.com/AbberiorInstruments/ImspectorDocs/issues/9 about
         + Constant OMAS_BF_MAX_DIMENSIONS is not explained, the value is 15.
         + Data type of OMAS_DT is not specified, it's an enum type in C++, which is stored as uint32.
       - In the future maybe:
         + Writing to OBF would in principle be possible (using the struct module)
-        + Read part (slice) of data (use flush points), currently data is read all at once (impractical for very large files)
         + may still crash if not all data is written in a stack (haven't seen such a stack yet)
         + if there is a problem with a stack (like unknown data type), we could simply ignore the stack and print a warning instead
 
@@ -37,12 +77,24 @@
 """
 
 from __future__ import annotations
-from collections import namedtuple
+from collections import namedtuple, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import struct
+import threading
+import weakref
 import zlib
+import json
 import math
+import os
+import tempfile
 import numpy as np
 
+# single int value (length of strings)
+int_fmt = '<I'
+int_len = struct.calcsize(int_fmt)
+int_unpack = struct.Struct(int_fmt).unpack_from
+
 # single long value
 long_fmt = '<Q'
 long_len = struct.calcsize(long_fmt)
@@ -55,58 +107,114 @@ file_header_unpack = struct.Struct(file_header_fmt).unpack_from
 FILE_MAGIC_HEADER = b'OMAS_BF\n\xff\xff'
 
 # stack header = char[16], uint32, uint32, uint32[15], double[15], double[15], uint32, uint32, uint32, uint32, uint32, uint64, uint64, uint64
-stack_header_fmt = '<16s17I30d5I3Q'
-stack_header_len = struct.calcsize(stack_header_fmt)
-stack_header_unpack = struct.Struct(stack_header_fmt).unpack_from
+stack_header_dtype = np.dtype([('magic_header', 'S16'), ('format_version', '<u4'), ('rank', '<u4'),
+                               ('shape', '<u4', (15,)), ('lengths', '<f8', (15,)), ('offsets', '<f8', (15,)),
+                               ('data_type', '<u4'), ('compression_type', '<u4'), ('compression_level', '<u4'),
+                               ('name_length', '<u4'), ('description_length', '<u4'), ('reserved', '<u8'),
+                               ('data_length', '<u8'), ('next_stack_pos', '<u8')])
+stack_header_len = stack_header_dtype.itemsize
 STACK_MAGIC_HEADER = b'OMAS_BF_STACK\n\xff\xff'
 
-# stack footer version 1 = uint32, uint32[15], uint32[15]
-stack_footer_v1_fmt = '<31I'
-stack_footer_v1_len = struct.calcsize(stack_footer_v1_fmt)
-stack_footer_v1_unpack = struct.Struct(stack_footer_v1_fmt).unpack_from
-
-# stack footer version 1A = version 1 + uint32 (we only store the difference)
-stack_footer_v1a_fmt = '<I'
-stack_footer_v1a_len = struct.calcsize(stack_footer_v1a_fmt)
-stack_footer_v1a_unpack = struct.Struct(stack_footer_v1a_fmt).unpack_from
-
-# OBF_SI_FRACTION = int32[2] = '2i'
-# OBF_SI_UNIT = OBF_SI_FRACTION[9], double = '18id'
-
-# stack footer version 2 = version1A + OBF_SI_UNIT, OBF_SI_UNIT[15]
-stack_footer_v2_fmt = '<' + '18id' * 16
-stack_footer_v2_len = struct.calcsize(stack_footer_v2_fmt)
-stack_footer_v2_unpack = struct.Struct(stack_footer_v2_fmt).unpack_from
-
-# stack footer version 3 = version 2 + uint64, uint64
-stack_footer_v3_fmt = '<2Q'
-stack_footer_v3_len = struct.calcsize(stack_footer_v3_fmt)
-stack_footer_v3_unpack = struct.Struct(stack_footer_v3_fmt).unpack_from
-
-# stack footer version 4 = version 3 + uint64
-stack_footer_v4_fmt = '<Q'
-stack_footer_v4_len = struct.calcsize(stack_footer_v4_fmt)
-stack_footer_v4_unpack = struct.Struct(stack_footer_v4_fmt).unpack_from
-
-# stack footer version 5 = version 4 + uin64, uint32
-stack_footer_v5_fmt = '<QI'
-stack_footer_v5_len = struct.calcsize(stack_footer_v5_fmt)
-stack_footer_v5_unpack = struct.Struct(stack_footer_v5_fmt).unpack_from
-
-# stack footer version 5a = version 5 + uint64
-stack_footer_v5a_fmt = '<Q'
-stack_footer_v5a_len = struct.calcsize(stack_footer_v5a_fmt)
-stack_footer_v5a_unpack = struct.Struct(stack_footer_v5a_fmt).unpack_from
-
-# stack footer version 6 = version 5a + uint64, uint64
-stack_footer_v6_fmt = '<2Q'
-stack_footer_v6_len = struct.calcsize(stack_footer_v6_fmt)
-stack_footer_v6_unpack = struct.Struct(stack_footer_v6_fmt).unpack_from
+# OBF_SI_FRACTION = int32[2], OBF_SI_UNIT = OBF_SI_FRACTION[9], double
+si_unit_dtype = np.dtype([('exponents', '<i4', (9, 2)), ('scalefactor', '<f8')])
+
+# stack footer, each version appends fields to the previous version
+# version 1 = uint32, uint32[15], uint32[15]
+# version 1A (stored with version 2) = version 1 + uint32
+# version 2 = version 1A + OBF_SI_UNIT, OBF_SI_UNIT[15]
+# version 3 = version 2 + uint64, uint64
+# version 4 = version 3 + uint64
+# version 5 = version 4 + uint64, uint32
+# version 5A (stored with version 6) = version 5 + uint64
+# version 6 = version 5A + uint64, uint64
+stack_footer_fields = (
+    (1, [('footer_length', '<u4'), ('has_col_positions', '<u4', (15,)), ('has_col_labels', '<u4', (15,))]),
+    (2, [('metadata_length', '<u4'), ('si_value', si_unit_dtype), ('si_dimensions', si_unit_dtype, (15,))]),
+    (3, [('num_flush_points', '<u8'), ('flush_block_size', '<u8')]),
+    (4, [('tag_dictionary_length', '<u8')]),
+    (5, [('stack_end_disk', '<u8'), ('min_format_version', '<u4')]),
+    (6, [('stack_end_used_disk', '<u8'), ('samples_written', '<u8'), ('num_chunk_positions', '<u8')]))
+
+
+def stack_footer_dtype(format_version: int) -> np.dtype:
+    """
+    NumPy structured data type of the fixed size part of the stack footer of a given stack format version.
+    """
+    return np.dtype([field for version, fields in stack_footer_fields if version <= format_version
+                     for field in fields])
+
+
+def _struct_layout(dtype: np.dtype) -> tuple:
+    """
+    Internal function. Translates a little endian NumPy structured data type into a struct.Struct (decoding with
+    struct is much faster than with NumPy for single records) and the positions of the fields in the unpacked tuple
+    (an index for single values, a slice for arrays and nested structures, e.g. the 19 values of an SI unit).
+
+    :return: (struct.Struct, dict field name -> index or slice)
+    """
+    def flatten(dtype: np.dtype) -> list:
+        # struct format characters of all values
+        if dtype.subdtype is not None:
+            base, shape = dtype.subdtype
+            return flatten(base) * int(np.prod(shape))
+        if dtype.names is not None:
+            return [character for name in dtype.names for character in flatten(dtype.fields[name][0])]
+        if dtype.kind == 'S':
+            return ['{}s'.format(dtype.itemsize)]
+        return [{'u4': 'I', 'i4': 'i', 'u8': 'Q', 'f8': 'd'}[dtype.str[1:]]]
+
+    positions = {}
+    characters = []
+    for name in dtype.names:
+        field = flatten(dtype.fields[name][0])
+        scalar = dtype.fields[name][0].shape == () and dtype.fields[name][0].names is None
+        positions[name] = len(characters) if scalar else slice(len(characters), len(characters) + len(field))
+        characters += field
+    layout = struct.Struct('<' + ''.join(characters))
+    assert layout.size == dtype.itemsize
+    return layout, positions
+
+
+stack_header_struct, stack_header_positions = _struct_layout(stack_header_dtype)
+stack_header_unpack = stack_header_struct.unpack_from
+_stack_footer_layouts = {}
+
+
+def stack_footer_layout(format_version: int) -> tuple:
+    """
+    struct.Struct and field positions (see _struct_layout) of the fixed size part of the stack footer of a given stack
+    format version.
+    """
+    layout = _stack_footer_layouts.get(format_version)
+    if layout is None:
+        layout = _stack_footer_layouts[format_version] = _struct_layout(stack_footer_dtype(format_version))
+    return layout
+
+
+# suffix and version of the stack index files written next to OBF files (see File(..., use_index=True))
+INDEX_SUFFIX = '.obfindex'
+INDEX_VERSION = 1
+
+# number of bytes read from the file at once when parsing headers and footers
+HEADER_BUFFER_SIZE = 1 << 16
+
+# number of bytes read from the file at once when streaming stack data
+STREAM_BLOCK_SIZE = 1 << 20
+
+# tables in the stack footer are stored as NumPy arrays (chunk positions with the implicit first chunk [0, 0])
+col_positions_dtype = np.dtype('<f8')
+flush_positions_dtype = np.dtype('<u8')
+chunk_positions_dtype = np.dtype([('logical', '<u8'), ('file', '<u8')])
 
 # mapping of OMAS_DT to NumPy data types (see https://numpy.org/doc/stable/user/basics.types.html)
 omas_data_types = {0x00000001: np.uint8, 0x00000002: np.int8, 0x00000004: np.uint16, 0x00000008: np.int16,
                    0x00000010: np.uint32, 0x00000020: np.int32, 0x00000040: np.float32, 0x00000080: np.float64,
                    0x00001000: np.uint64, 0x00002000: np.int64, 0x00010000: np.bool_}
+omas_data_type_codes = {data_type: code for code, data_type in omas_data_types.items()}
+
+# positional reads (thread-safe, without moving the file position) are not available on all platforms
+_has_pread = hasattr(os, 'pread')
+_has_preadv = hasattr(os, 'preadv')
 
 # named tuple used in SIUnit
 Fraction = namedtuple('Fraction', ('numerator', 'denominator'))
@@ -124,42 +232,84 @@ class File:
         - stacks (list of Stack)
     """
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, stack_filter=None, lazy: bool = None, use_index: bool = False,
+                 memory_map: bool = True, streaming: bool = True, buffer_size: int = HEADER_BUFFER_SIZE,
+                 scratch_dir: str = None):
         """
         Create a new OBF file access object by providing a file path:
         obf = File(file_path)
 
         :param file_path: path of the OBF file
+        :param stack_filter: if given, only stacks whose name contains this string (or, if it is a callable, for which
+            stack_filter(stack) is True; only the stack header is available at that time) are contained in stacks
+        :param lazy: if True, a stack footer is read when one of its attributes (or the data) is accessed the first
+            time (which fails once the file is closed), otherwise all footers are read immediately; default is True
+            if a stack_filter is given and False otherwise
+        :param use_index: if True, the stack headers and footer tables are taken from an index file next to the file
+            (file_path + INDEX_SUFFIX) if it is still valid (same file size and modification time), otherwise all
+            stacks are read and the index file is (re-)written
+        :param memory_map: if True, uncompressed and contiguously stored stacks are memory mapped instead of read
+        :param streaming: if True, stack data is read and inflated block by block into a preallocated array, otherwise
+            all (compressed) bytes are read and inflated at once
+        :param buffer_size: number of bytes read at once when parsing the headers and footers (0 reads every value
+            on its own)
+        :param scratch_dir: if given, stack data that isn't memory mapped from the file is inflated into a temporary
+            file in this directory and memory mapped from there (for stacks larger than the available memory)
         """
+        self._memory_map = memory_map
+        self._scratch_dir = scratch_dir
+        self._stack_table = None
+        self._streaming = streaming
+        self._buffer_size = buffer_size
+        if lazy is None:
+            lazy = stack_filter is not None
+        if isinstance(stack_filter, str):
+            name_part = stack_filter
+            stack_filter = lambda stack: name_part in stack.name
         # we cannot use "with open as" because we read the data stacks content later
         try:
             # open the file at the given file path
             self._file = open(file_path, 'rb')
+            self._lock = threading.Lock()
             self._file.seek(0, 2)  # seek to the end of the file
             file_size = self._file.tell()
+            self._file_size = file_size
             self._file.seek(0)
 
+            # use the stack index next to the file if it is still valid
+            index_path = file_path + INDEX_SUFFIX
+            if use_index:
+                if self._read_index(index_path):
+                    if stack_filter is not None:
+                        self.stacks = [stack for stack in self.stacks if stack_filter(stack)]
+                    return
+                # the index contains all stacks including their footers, filter only afterwards
+                index_filter, stack_filter, lazy = stack_filter, None, False
+
+            # all meta data is parsed from larger blocks read at once
+            reader = _BufferedReader(self._pread, 0, buffer_size)
+
             # read the obf file header
-            data = self._file.read(file_header_len)
+            data = reader.read(file_header_len)
             magic_header, self.format_version, first_stack_pos, description_len = file_header_unpack(data)
             if magic_header != FILE_MAGIC_HEADER:
                 raise RuntimeError('Magic file header not found.')
 
             # read file description
-            self.description = self._read_string(description_len)
+            self.description = reader.read_string(description_len)
 
             # read file meta data
             if self.format_version >= 2:
                 # read meta data position
-                file_meta_data_pos = long_unpack(self._file.read(long_len))[0]
-                self._file.seek(file_meta_data_pos)
+                file_meta_data_pos = long_unpack(reader.read(long_len))[0]
+                reader.seek(file_meta_data_pos)
 
                 self.meta = {}
-                key = self._read_string()
+                key = reader.read_string()
                 while len(key) > 0:
-                    value = self._read_string()
+                    value = reader.read_string()
                     self.meta[key] = value
-                    key = self._read_string()
+                    key = reader.read_string()
 
             # read all the stacks
             next_stack_pos = first_stack_pos
@@ -170,35 +320,36 @@ class File:
                 stack = Stack(self)
 
                 # seek to position of next stack header
-                self._file.seek(next_stack_pos)
+                reader.seek(next_stack_pos)
 
                 # read stack header
-                data = self._file.read(stack_header_len)
+                data = reader.read(stack_header_len)
                 values = stack_header_unpack(data)
-                if values[0] != STACK_MAGIC_HEADER:
+                fields = stack_header_positions
+                if values[fields['magic_header']] != STACK_MAGIC_HEADER:
                     raise RuntimeError('Magic stack header not found.')
 
                 # interpret stack header
-                stack.format_version = values[1]
-                stack.rank = values[2]
-                stack.shape = values[3:17][:stack.rank]
-                stack.lengths = values[18:32][:stack.rank]
-                stack.offsets = values[33:47][:stack.rank]
-                value = values[48]
+                stack.format_version = values[fields['format_version']]
+                stack.rank = rank = values[fields['rank']]
+                stack.shape = values[fields['shape']][:rank]
+                stack.lengths = values[fields['lengths']][:rank]
+                stack.offsets = values[fields['offsets']][:rank]
+                value = values[fields['data_type']]
                 if value not in omas_data_types:
                     raise RuntimeError('Unsupported data type {}.'.format(value))
                 else:
                     stack.data_type = omas_data_types[value]
-                stack._compression_type = values[49]
-                # compression_level = values[50] # relatively uninteresting, we ignore it
-                name_length = values[51]
-                description_length = values[52]
-                stack._data_length = values[54]  # data_len_disk
-                next_stack_pos = values[55]
-                stack.name = self._read_string(name_length)
-                stack.description = self._read_string(description_length)
-
-                stack._data_pos = self._file.tell()
+                stack._compression_type = values[fields['compression_type']]
+                # compression_level is relatively uninteresting, we ignore it
+                name_length = values[fields['name_length']]
+                description_length = values[fields['description_length']]
+                stack._data_length = values[fields['data_length']]  # data_len_disk
+                next_stack_pos = values[fields['next_stack_pos']]
+                stack.name = reader.read_string(name_length)
+                stack.description = reader.read_string(description_length)
+
+                stack._data_pos = reader.tell()
                 footer_pos = stack._data_pos + stack._data_length
 
                 # additionally we compute a dimensionality of a stack which is the number of elements in shape minus
@@ -208,139 +359,238 @@ class File:
                     dimensionality -= 1
                 stack.dimensionality = dimensionality
 
-                # default footer
-                footer = {
-                    'stack_end_used_disk': file_size,
-                    'samples_written': np.prod(stack.shape),
-                    'chunk_positions': [[0, 0]]
-                }
-
-                # read and interpret stack footer (for format version >= 1)
-                if stack.format_version >= 1:
-                    self._file.seek(footer_pos)
-
-                    # read version 1 part
-                    data = self._file.read(stack_footer_v1_len)
-                    values = stack_footer_v1_unpack(data)
-                    footer_length = values[0]
-                    footer['has_col_positions'] = values[1:15][:stack.rank]
-                    footer['has_col_labels'] = values[16:30][:stack.rank]
-
-                    if stack.format_version >= 2:
-                        # read version 1A part
-                        data = self._file.read(stack_footer_v1a_len)
-                        values = stack_footer_v1a_unpack(data)
-                        footer['metadata_length'] = values[0]
-
-                        # read version 2 part
-                        data = self._file.read(stack_footer_v2_len)
-                        values = stack_footer_v2_unpack(data)
-                        stack.si_value = SIUnit(values[0:19])
-                        stack.si_dimensions = []
-                        for i in range(stack.rank):
-                            stack.si_dimensions.append(SIUnit(values[i * 19:(i + 1) * 19]))
-
-                    if stack.format_version >= 3:
-                        # read version 3 part
-                        data = self._file.read(stack_footer_v3_len)
-                        values = stack_footer_v3_unpack(data)
-                        footer['num_flush_points'] = values[0]
-                        footer['flush_block_size'] = values[1]
-
-                    if stack.format_version >= 4:
-                        # read version 4 part
-                        data = self._file.read(stack_footer_v4_len)
-                        values = stack_footer_v4_unpack(data)
-                        footer['tag_dictionary_length'] = values[0]
-
-                    if stack.format_version >= 5:
-                        # read version 5 part
-                        data = self._file.read(stack_footer_v5_len)
-                        values = stack_footer_v5_unpack(data)
-                        footer['min_format_version'] = values[1]
-
-                    if stack.format_version >= 6:
-                        # read version 5a part
-                        data = self._file.read(stack_footer_v5a_len)
-                        values = stack_footer_v5a_unpack(data)
-                        footer['stack_end_used_disk'] = values[0]
-
-                        # read version 6 part
-                        data = self._file.read(stack_footer_v6_len)
-                        values = stack_footer_v6_unpack(data)
-                        footer['samples_written'] = values[0]
-                        footer['num_chunk_positions'] = values[1]
-
-                    # omit possible footer entries from later versions
-                    self._file.seek(footer_pos + footer_length)
-
-                    # read label strings
-                    stack.labels = [self._read_string() for _ in range(stack.rank)]
-
-                    # read col positions
-                    if 'has_col_positions' in footer:
-                        stack.col_positions = {}
-                        for axis, has_them in enumerate(footer['has_col_positions']):
-                            if has_them:
-                                # read doubles as positions
-                                fmt = '<{}d'.format(stack.shape[axis])
-                                data = self._file.read(struct.calcsize(fmt))
-                                values = struct.unpack_from(fmt, data)
-                                stack.col_positions[axis] = values
-
-                    # read col labels
-                    if 'has_col_labels' in footer:
-                        stack.col_labels = {}
-                        for axis, has_them in enumerate(footer['has_col_labels']):
-                            if has_them:
-                                # read labels
-                                labels = []
-                                for _ in range(stack.shape[axis]):
-                                    label = self._read_string()
-                                    labels.append(label)
-                                stack.col_labels[axis] = labels
-
-                    # read metadata
-                    if 'metadata_length' in footer:
-                        stack.metadata = self._read_string(footer['metadata_length'])
-
-                    # read flush positions
-                    if 'num_flush_points' in footer:
-                        length = footer['num_flush_points']
-                        fmt = '<{}Q'.format(length)
-                        data = self._file.read(struct.calcsize(fmt))
-                        values = struct.unpack_from(fmt, data)
-                        footer['flush_positions'] = values
-
-                    # read tag dictionary
-                    if 'tag_dictionary_length' in footer:
-                        stack.tag_dictionary = {}
-                        length = footer['tag_dictionary_length']
-                        if length > 0:
-                            # read key, value pairs until len(key) is zero
-                            key = self._read_string()
-                            while len(key) > 0:
-                                value = self._read_string()
-                                stack.tag_dictionary[key] = value
-                                key = self._read_string()
-
-                    # read chunk positions
-                    chunk_positions = [[0, 0]]
-                    for _ in range(footer.get('num_chunk_positions', 0)):
-                        fmt = '<2Q'
-                        data = self._file.read(struct.calcsize(fmt))
-                        values = struct.unpack_from(fmt, data)
-                        chunk_positions.append(values)
-                    footer['chunk_positions'] = chunk_positions
-
-                stack.footer = footer
+                # skip stacks not matching the filter before reading their footer
+                if stack_filter is not None and not stack_filter(stack):
+                    continue
+
+                # stack footer (read lazily when its attributes are first accessed)
+                stack._footer_pos = footer_pos
+                if not lazy:
+                    self._read_footer(stack, reader)
 
                 # append stack to list
                 self.stacks.append(stack)
+
+            if use_index:
+                self._write_index(index_path)
+                if index_filter is not None:
+                    self.stacks = [stack for stack in self.stacks if index_filter(stack)]
         except:
             self.close()
             raise
 
+    def _read_footer(self, stack: Stack, reader: _BufferedReader = None):
+        """
+        Internal function. Reads and interprets the stack footer (for format version >= 1) and stores the footer
+        dictionary and the attributes from the footer (labels, col_positions, col_labels, metadata, tag_dictionary,
+        si_value, si_dimensions) in the stack.
+
+        :param stack: A Stack object containing the meta data from the stack header
+        :param reader: Reader to use (if already open), otherwise the footer is read with a new reader
+        """
+        # errors are raised without closing the file, the other stacks stay usable
+        if reader is None:
+            reader = _BufferedReader(self._pread, stack._footer_pos, self._buffer_size)
+
+        # default footer
+        footer = {
+            'stack_end_used_disk': self._file_size,
+            'samples_written': int(np.prod(stack.shape)),
+            'chunk_positions': np.zeros(1, dtype=chunk_positions_dtype)
+        }
+
+        # read and interpret stack footer (for format version >= 1)
+        if stack.format_version >= 1:
+            reader.seek(stack._footer_pos)
+
+            # read the fixed size part of all versions up to the stack format version at once
+            footer_struct, fields = stack_footer_layout(stack.format_version)
+            values = footer_struct.unpack_from(reader.read(footer_struct.size))
+            footer_length = values[fields['footer_length']]
+            footer['has_col_positions'] = list(values[fields['has_col_positions']][:stack.rank])
+            footer['has_col_labels'] = list(values[fields['has_col_labels']][:stack.rank])
+
+            if stack.format_version >= 2:
+                footer['metadata_length'] = values[fields['metadata_length']]
+                stack.si_value = SIUnit(values[fields['si_value']])
+                si_dimensions = values[fields['si_dimensions']]
+                stack.si_dimensions = [SIUnit(si_dimensions[i * 19:(i + 1) * 19]) for i in range(stack.rank)]
+
+            if stack.format_version >= 3:
+                footer['num_flush_points'] = values[fields['num_flush_points']]
+                footer['flush_block_size'] = values[fields['flush_block_size']]
+
+            if stack.format_version >= 4:
+                footer['tag_dictionary_length'] = values[fields['tag_dictionary_length']]
+
+            if stack.format_version >= 5:
+                footer['min_format_version'] = values[fields['min_format_version']]
+
+            if stack.format_version >= 6:
+                footer['stack_end_used_disk'] = values[fields['stack_end_used_disk']]
+                footer['samples_written'] = values[fields['samples_written']]
+                footer['num_chunk_positions'] = values[fields['num_chunk_positions']]
+
+            # omit possible footer entries from later versions
+            reader.seek(stack._footer_pos + footer_length)
+
+            # read label strings
+            stack.labels = [reader.read_string() for _ in range(stack.rank)]
+
+            # read col positions
+            if 'has_col_positions' in footer:
+                stack.col_positions = {}
+                for axis, has_them in enumerate(footer['has_col_positions']):
+                    if has_them:
+                        # read doubles as positions
+                        data = reader.read(stack.shape[axis] * col_positions_dtype.itemsize)
+                        stack.col_positions[axis] = np.frombuffer(data, dtype=col_positions_dtype).copy()
+
+            # read col labels
+            if 'has_col_labels' in footer:
+                stack.col_labels = {}
+                for axis, has_them in enumerate(footer['has_col_labels']):
+                    if has_them:
+                        # read labels
+                        labels = []
+                        for _ in range(stack.shape[axis]):
+                            label = reader.read_string()
+                            labels.append(label)
+                        stack.col_labels[axis] = labels
+
+            # read metadata
+            if 'metadata_length' in footer:
+                stack.metadata = reader.read_string(footer['metadata_length'])
+
+            # read flush positions
+            if 'num_flush_points' in footer:
+                data = reader.read(footer['num_flush_points'] * flush_positions_dtype.itemsize)
+                footer['flush_positions'] = np.frombuffer(data, dtype=flush_positions_dtype).copy()
+
+            # read tag dictionary
+            if 'tag_dictionary_length' in footer:
+                stack.tag_dictionary = {}
+                length = footer['tag_dictionary_length']
+                if length > 0:
+                    # read key, value pairs until len(key) is zero
+                    key = reader.read_string()
+                    while len(key) > 0:
+                        value = reader.read_string()
+                        stack.tag_dictionary[key] = value
+                        key = reader.read_string()
+
+            # read chunk positions
+            length = footer.get('num_chunk_positions', 0)
+            chunk_positions = np.zeros(length + 1, dtype=chunk_positions_dtype)
+            data = reader.read(length * chunk_positions_dtype.itemsize)
+            chunk_positions[1:] = np.frombuffer(data, dtype=chunk_positions_dtype)
+            footer['chunk_positions'] = chunk_positions
+
+        stack.footer = footer
+        stack._footer_read = True
+
+    def _index_key(self) -> dict:
+        """
+        Internal function. Identifies the file content for which an index is valid.
+        """
+        status = os.fstat(self._file.fileno())
+        return {'index_version': INDEX_VERSION, 'file_size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+    def _read_index(self, index_path: str) -> bool:
+        """
+        Internal function. Reads the file and stack meta data from an index file (see _write_index). Stack footers
+        other than the footer dictionary itself are still read lazily from the file.
+
+        :param index_path: Path of the index file
+        :return: True if the index file exists and is valid for this file
+        """
+        try:
+            with open(index_path, 'rb') as file:
+                index = json.loads(zlib.decompress(file.read()).decode('utf-8'))
+        except (OSError, ValueError, zlib.error):
+            return False
+        if index.get('key') != self._index_key():
+            return False
+
+        self.format_version = index['format_version']
+        self.description = index['description']
+        if index['meta'] is not None:
+            self.meta = index['meta']
+        self.stacks = []
+        for values in index['stacks']:
+            stack = Stack(self)
+            for name in Stack._index_attributes:
+                setattr(stack, name, values[name])
+            stack.shape = tuple(stack.shape)
+            stack.lengths = tuple(stack.lengths)
+            stack.offsets = tuple(stack.offsets)
+            stack.data_type = omas_data_types[values['data_type']]
+            if 'flush_positions' in stack.footer:
+                stack.footer['flush_positions'] = np.array(stack.footer['flush_positions'], dtype=flush_positions_dtype)
+            stack.footer['chunk_positions'] = np.array([tuple(position) for position in stack.footer['chunk_positions']],
+                                                       dtype=chunk_positions_dtype)
+            self.stacks.append(stack)
+        return True
+
+    def _write_index(self, index_path: str):
+        """
+        Internal function. Writes the file and stack meta data (headers and footer dictionaries with chunk and flush
+        positions) to a small, compressed JSON index file, so that the next File(path, use_index=True) doesn't need to
+        walk through all stacks. Problems writing the index (e.g. read-only directories) are ignored.
+
+        :param index_path: Path of the index file
+        """
+        stacks = []
+        for stack in self.stacks:
+            values = {name: getattr(stack, name) for name in Stack._index_attributes}
+            values['data_type'] = omas_data_type_codes[stack.data_type]
+            values['footer'] = {key: value.tolist() if isinstance(value, np.ndarray) else value
+                                 for key, value in stack.footer.items()}
+            stacks.append(values)
+        index = {'key': self._index_key(), 'format_version': self.format_version, 'description': self.description,
+                 'meta': getattr(self, 'meta', None), 'stacks': stacks}
+        try:
+            with open(index_path + '.tmp', 'wb') as file:
+                file.write(zlib.compress(json.dumps(index, separators=(',', ':')).encode('utf-8')))
+            os.replace(index_path + '.tmp', index_path)
+        except OSError:
+            pass
+
+    @property
+    def stack_table(self) -> np.ndarray:
+        """
+        Header values of all stacks as NumPy structured array with one record per stack in stacks and the fields name,
+        rank, shape, lengths, offsets (padded to 15 dimensions like in the file), data_type (OMAS_DT code, see
+        omas_data_type_codes), compression_type, dimensionality, data_pos and data_length. Allows vectorized
+        selection of stacks, e.g. of all 2D uint16 stacks:
+
+        table = obf.stack_table
+        uint16 = obf_support.omas_data_type_codes[numpy.uint16]
+        mask = (table['dimensionality'] == 2) & (table['data_type'] == uint16)
+        stacks = [obf.stacks[i] for i in numpy.flatnonzero(mask)]
+        """
+        if self._stack_table is None:
+            name_length = max([len(stack.name) for stack in self.stacks] + [1])
+            dtype = np.dtype([('name', 'U{}'.format(name_length)), ('rank', '<u4'), ('shape', '<u4', (15,)),
+                              ('lengths', '<f8', (15,)), ('offsets', '<f8', (15,)), ('data_type', '<u4'),
+                              ('compression_type', '<u4'), ('dimensionality', '<u4'), ('data_pos', '<u8'),
+                              ('data_length', '<u8')])
+            # filled column by column from the parsed header values
+            stacks = self.stacks
+            table = np.zeros(len(stacks), dtype=dtype)
+            table['name'] = [stack.name for stack in stacks]
+            table['rank'] = [stack.rank for stack in stacks]
+            table['shape'] = [stack.shape + (1,) * (15 - stack.rank) for stack in stacks]
+            table['lengths'] = [stack.lengths + (0,) * (15 - stack.rank) for stack in stacks]
+            table['offsets'] = [stack.offsets + (0,) * (15 - stack.rank) for stack in stacks]
+            table['data_type'] = [omas_data_type_codes[stack.data_type] for stack in stacks]
+            table['compression_type'] = [stack._compression_type for stack in stacks]
+            table['dimensionality'] = [stack.dimensionality for stack in stacks]
+            table['data_pos'] = [stack._data_pos for stack in stacks]
+            table['data_length'] = [stack._data_length for stack in stacks]
+            self._stack_table = table
+        return self._stack_table
+
     def find_stack_by_name(self, name_part: str) -> list[Stack]:
         """
         Small convenience method. Will return all stacks in this OBF file where string is contained in the stack name.
@@ -354,29 +604,45 @@ class File:
         if not self._file.closed:
             self._file.close()
 
-    def _read_string(self, length: int = None) -> str:
+    def _pread(self, pos: int, length: int) -> bytes:
         """
-        For internal use only.
-        :param length: Number of bytes to read, if none is given, reads the length first.
-        :return: Decoded string
+        Internal function. Reads length bytes (less at the end of the file) at position pos without using the file
+        position, so that several threads can read from the file at the same time. Uses os.pread where available,
+        otherwise (Windows) seek and read are done under a lock.
         """
-        if length is None:
-            fmt = '<I'
-            data = self._file.read(struct.calcsize(fmt))
-            length = struct.unpack_from(fmt, data)[0]
+        if not _has_pread:
+            with self._lock:
+                self._file.seek(pos)
+                return self._file.read(length)
+        # short reads are possible, continue until length bytes are read or the end of the file is reached
+        parts = []
+        while length > 0:
+            data = os.pread(self._file.fileno(), length, pos)
+            if not data:
+                break
+            parts.append(data)
+            pos += len(data)
+            length -= len(data)
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    def load_stacks(self, stacks: list[Stack], workers: int = None) -> list[np.ndarray]:
+        """
+        Loads the data of several stacks of this file at the same time (e.g. all channels of a measurement), stacks
+        that are already loaded are not read again.
 
-        fmt = '<{}s'.format(length)
-        data = self._file.read(struct.calcsize(fmt))
-        string = struct.unpack_from(fmt, data)[0]  # unpack always returns a tuple
-        try:
-            string = string.decode('utf-8')
-        except UnicodeDecodeError:
-            # fallback encoding for very old (<2008) files
-            string = string.decode('iso-8859-1')
+        :param stacks: Stacks of this file
+        :param workers: Number of threads, default is the number of CPUs
+        :return: List with the data of each stack
+        """
+        def load(stack):
+            if stack._data is None:
+                self._read_stack(stack)
+            return stack._data
 
-        return string
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            return list(executor.map(load, stacks))
 
-    def _read_stack(self, stack: Stack):
+    def _read_stack(self, stack: Stack, workers: int = 1, out=None, scratch_dir: str = None):
         """
         Internal function. Reads the data array from a stack from the OBF file as a NumPy array and stores it as the
         _data attribute of the stack. If called a second time, will re-read the stack.
@@ -388,67 +654,452 @@ class File:
         we need to workaround it.
 
         :param stack: A Stack object containing all meta data
+        :param workers: Number of threads inflating the blocks between flush points concurrently (if there are any)
+        :param out: Writable buffer the data is decoded into (see _allocate)
+        :param scratch_dir: Directory of a temporary file the data is decoded into (default is the scratch_dir of
+            the file)
         """
+        if out is not None:
+            # check the buffer first, unsuitable buffers are a usage error and don't close the file
+            out = self._allocate(stack, out)
         try:
-            # read the whole stack data (works for stack format versions <= 5)
-            # self._file.seek(stack._data_pos)
-            # data = self._file.read(stack._data_length)
-
-            # with chunks (works for min_format_version 6 and also below)
-            pos = 0
-            idx = 0
-            seek_pos = stack._data_pos
-            self._file.seek(seek_pos)
-            data = []
-            if stack._compression_type == 1 and stack.footer['samples_written'] > 0:
-                # if compressed and not empty: we are not completely sure about the length of the written data
-                if 'num_chunk_positions' in stack.footer:
-                    # stack format version >= 6 (with chunks)
-                    bytes_written = min(stack.footer['samples_written']*stack.data_type().itemsize+16, stack.footer['chunk_positions'][-1][0] + stack.footer['stack_end_used_disk'] - stack.footer['chunk_positions'][-1][1])  # this is a bit heuristic and not documented but I don't want to read too much
-                    # stack.footer['chunk_positions'][-1][0] + stack.footer['stack_end_used_disk'] - stack.footer['chunk_positions'][-1][1] is the maximal number of bytes between the begin of the last chunk and the end of the data
-                    # stack.footer['samples_written']*stack.data_type().itemsize+16 is the size of the uncompressed data plus a small overhead for the zip header that is also divisible by all data type sizes in bytes
-                else:
-                    # stack format version < 6 (without chunks)
-                    bytes_written = stack._data_length
+            if out is None and self._memory_map and self._is_mappable(stack):
+                # map the stack data directly from the file, no bytes are copied until the pixels are accessed
+                with self._lock:  # np.memmap moves the file position
+                    array = np.memmap(self._file, dtype=stack.data_type, mode='r', offset=stack._data_pos,
+                                      shape=(stack.footer['samples_written'],))
+                array = np.reshape(array, stack.shape[::-1])
+                stack._data = np.transpose(array)
+                data_cache.add(stack, 0)  # mapped data is not held in memory
+                return
+
+            bytes_written = self._bytes_written(stack)
+            scratch_dir = scratch_dir if scratch_dir is not None else self._scratch_dir
+            parallel = workers > 1 and stack._compression_type == 1 and len(stack.footer.get('flush_positions', ())) > 0
+            if not parallel and not self._streaming and out is None and scratch_dir is None:
+                array = self._read_stack_at_once(stack, bytes_written)
             else:
-                # if not compressed or empty, we know the number of bytes exactly
-                bytes_written = stack.footer['samples_written'] * stack.data_type().itemsize
-
-            # read (using the algorithm outlined in the format description)==
-            while pos < bytes_written:
-                bytes_to_read = bytes_written - pos
-                if idx < len(stack.footer['chunk_positions']):
-                    if pos + bytes_to_read > stack.footer['chunk_positions'][idx][0]:  # chunk_positions[0] = logical offset, [1] = file offset
-                        bytes_to_read = stack.footer['chunk_positions'][idx][0] - pos
-                        seek_pos = stack.footer['chunk_positions'][idx][1] + stack._data_pos
-                        idx += 1
-                if bytes_to_read > 0:
-                    data.append(self._file.read(bytes_to_read))
-                self._file.seek(seek_pos)
-                pos += bytes_to_read
-
-            data = b"".join(data)  # is there a more efficient way to concatenate byte arrays?
-
-            # if compressed, uncompress
-            if stack._compression_type == 1:
-                zobj = zlib.decompressobj()
-                data = zobj.decompress(data)
-                # data = zlib.decompress(data) # that gave "zlib.error: Error -5 while decompressing data: incomplete or truncated stream" sometimes
-
-            # convert to numpy array
-            array = np.frombuffer(data, dtype=stack.data_type)
-            array = array[:stack.footer['samples_written']]  # not sure if this is needed anymore
+                array = out if out is not None else self._allocate(stack, scratch_dir=scratch_dir)
+                if parallel:
+                    self._inflate_stack_parallel(stack, bytes_written, workers, array)
+                elif self._streaming:
+                    self._inflate_stack(stack, bytes_written, array)
+                else:
+                    array[:] = self._read_stack_at_once(stack, bytes_written)
 
             # reshape (with reversed shape and then reverse order of dimensions)
+            nbytes = 0 if isinstance(array, np.memmap) else array.nbytes  # only data in memory counts
             array = np.reshape(array, stack.shape[::-1])
             array = np.transpose(array)
 
             # store
             stack._data = array
+            data_cache.add(stack, nbytes)
+        except:
+            self.close()
+            raise
+
+    def _bytes_written(self, stack: Stack) -> int:
+        """
+        Internal function. Number of (possibly compressed) bytes of the logical data stream of a stack. For compressed
+        stacks this is an upper bound, the actual end of the stream is only known after inflating it (reading stops
+        there).
+
+        :param stack: A Stack object containing all meta data
+        """
+        if stack._compression_type == 1 and stack.footer['samples_written'] > 0:
+            # if compressed and not empty: we are not completely sure about the length of the written data
+            if 'num_chunk_positions' in stack.footer:
+                # stack format version >= 6 (with chunks): the maximal number of bytes between the begin of the last
+                # chunk and the end of the data
+                last_chunk = stack.footer['chunk_positions'][-1]
+                bytes_written = int(last_chunk['logical']) + stack.footer['stack_end_used_disk'] - int(last_chunk['file'])
+            else:
+                # stack format version < 6 (without chunks)
+                bytes_written = stack._data_length
+        else:
+            # if not compressed or empty, we know the number of bytes exactly
+            bytes_written = stack.footer['samples_written'] * stack.data_type().itemsize
+        return bytes_written
+
+    def _plan_reads(self, stack: Stack, start: int, stop: int) -> list:
+        """
+        Internal function. Translates the bytes [start, stop) of the logical data stream of a stack into a minimal list
+        of reads. The logical stream is stored in chunks, chunk_positions[i] = [logical offset, file offset relative
+        to the data position] (see the algorithm outlined in the format description), adjacent chunks are merged.
+
+        :param stack: A Stack object containing all meta data
+        :param start: Logical offset of the first byte
+        :param stop: Logical offset after the last byte
+        :return: List of (file offset, length, offset in the destination)
+        """
+        plan = []
+        chunk_positions = stack.footer['chunk_positions']
+        # only the chunks overlapping [start, stop)
+        first = max(int(np.searchsorted(chunk_positions['logical'], start, side='right')) - 1, 0)
+        last = int(np.searchsorted(chunk_positions['logical'], stop, side='left'))
+        chunk_positions = chunk_positions[first:last + 1].tolist()
+        for idx, (logical_pos, file_pos) in enumerate(chunk_positions):
+            chunk_start = max(start, logical_pos)
+            chunk_end = min(stop, chunk_positions[idx + 1][0] if idx + 1 < len(chunk_positions) else stop)
+            if chunk_start >= chunk_end:
+                continue
+            file_offset = stack._data_pos + file_pos + chunk_start - logical_pos
+            if plan and plan[-1][0] + plan[-1][1] == file_offset and plan[-1][2] + plan[-1][1] == chunk_start - start:
+                plan[-1] = (plan[-1][0], plan[-1][1] + chunk_end - chunk_start, plan[-1][2])
+            else:
+                plan.append((file_offset, chunk_end - chunk_start, chunk_start - start))
+        return plan
+
+    def _read_range(self, stack: Stack, start: int, stop: int, buffer: memoryview = None) -> memoryview:
+        """
+        Internal function. Reads the bytes [start, stop) of the logical data stream of a stack into a buffer (a new
+        bytearray if none is given) following the read plan. Never reads past the end of the stream (see
+        _bytes_written).
+
+        :param stack: A Stack object containing all meta data
+        :param start: Logical offset of the first byte
+        :param stop: Logical offset after the last byte
+        :param buffer: Writable buffer of at least stop - start bytes
+        :return: Part of the buffer that was filled (shorter at the end of the file)
+        """
+        stop = max(min(stop, self._bytes_written(stack)), start)
+        if buffer is None:
+            buffer = bytearray(stop - start)
+        buffer = memoryview(buffer).cast('B')
+        length = 0
+        for file_offset, size, offset in self._plan_reads(stack, start, stop):
+            length = offset + self._preadinto(file_offset, buffer[offset:offset + size])
+            if length < offset + size:
+                break  # end of file
+        return buffer[:length]
+
+    def _preadinto(self, pos: int, buffer: memoryview) -> int:
+        """
+        Internal function. Like _pread but reads into a buffer (os.preadv where available).
+
+        :return: Number of bytes read (less than the size of the buffer at the end of the file)
+        """
+        if not _has_preadv:
+            with self._lock:
+                self._file.seek(pos)
+                length = 0
+                while length < buffer.nbytes:
+                    size = self._file.readinto(buffer[length:])
+                    if not size:
+                        break
+                    length += size
+                return length
+        length = 0
+        while length < buffer.nbytes:
+            size = os.preadv(self._file.fileno(), [buffer[length:]], pos + length)
+            if not size:
+                break
+            length += size
+        return length
+
+    def _iter_stream(self, stack: Stack, start: int, stop: int, block_size: int = STREAM_BLOCK_SIZE):
+        """
+        Internal function. Generator over the bytes [start, stop) of the logical data stream of a stack in blocks of at
+        most block_size bytes. All blocks are read into the same buffer, so a block is only valid until the next one
+        is requested.
+
+        :param stack: A Stack object containing all meta data
+        :param start: Logical offset of the first byte
+        :param stop: Logical offset after the last byte
+        :param block_size: Maximal number of bytes per block
+        """
+        buffer = bytearray(min(block_size, max(stop - start, 0)))
+        for pos in range(start, stop, block_size):
+            block = self._read_range(stack, pos, min(stop, pos + block_size), buffer)
+            if len(block) > 0:
+                yield block
+            if len(block) < min(stop, pos + block_size) - pos:
+                return  # end of file
+
+    def _digest(self, stack: Stack) -> str:
+        """
+        Internal function. BLAKE2b hash of the stored (possibly compressed) bytes of the logical data stream of a stack
+        together with its shape, data type and compression type. Nothing is inflated.
+
+        :param stack: A Stack object containing all meta data
+        :return: Hexadecimal digest (40 characters)
+        """
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(json.dumps([list(stack.shape), np.dtype(stack.data_type()).str, stack._compression_type,
+                                  int(stack.footer['samples_written'])]).encode())
+        for block in self._iter_stream(stack, 0, self._bytes_written(stack)):
+            hasher.update(block)
+        return hasher.hexdigest()
+
+    def _allocate(self, stack: Stack, out=None, scratch_dir: str = None) -> np.ndarray:
+        """
+        Internal function. Allocates the flat array with samples_written elements that the data of a stack is decoded
+        into: a view of the caller supplied buffer out, a NumPy memmap of an anonymous temporary file in scratch_dir
+        (removed as soon as the memmap isn't used anymore), or otherwise a new array in memory.
+
+        :param stack: A Stack object containing all meta data
+        :param out: Writable, contiguous buffer (e.g. a NumPy array or bytearray) of at least samples_written times
+            the item size of the data type bytes
+        :param scratch_dir: Directory of the temporary file
+        """
+        samples_written = stack.footer['samples_written']
+        if out is not None:
+            buffer = memoryview(out)
+            if buffer.readonly or not buffer.contiguous:
+                raise ValueError('The output buffer must be writable and contiguous.')
+            buffer = buffer.cast('B')
+            nbytes = samples_written * stack.data_type().itemsize
+            if buffer.nbytes < nbytes:
+                raise ValueError('The output buffer has {} bytes, but {} are needed.'.format(buffer.nbytes, nbytes))
+            return np.frombuffer(buffer, dtype=stack.data_type, count=samples_written)
+        if scratch_dir is not None and samples_written > 0:
+            with tempfile.TemporaryFile(dir=scratch_dir) as file:
+                return np.memmap(file, dtype=stack.data_type, mode='w+', shape=(samples_written,))
+        return np.empty(samples_written, dtype=stack.data_type)
+
+    def _inflate_stack(self, stack: Stack, bytes_written: int, array: np.ndarray):
+        """
+        Internal function. Streams the data of a stack block by block into a preallocated flat NumPy array, inflating
+        compressed data on the fly. Peak memory is the decoded array plus about one block.
+
+        :param stack: A Stack object containing all meta data
+        :param bytes_written: Number of bytes of the logical data stream
+        :param array: Flat array with samples_written elements (see _allocate)
+        """
+        self._inflate_into(stack, bytes_written, memoryview(array).cast('B'), 0)
+
+    def _inflate_into(self, stack: Stack, bytes_written: int, buffer: memoryview, start: int):
+        """
+        Internal function. Fills buffer with the decoded bytes [start, start + len(buffer)) of the data of a stack.
+
+        :param stack: A Stack object containing all meta data
+        :param bytes_written: Number of bytes of the logical data stream
+        :param buffer: Writable byte buffer
+        :param start: Offset of the first decoded byte
+        """
+        for _ in self._iter_inflated(stack, bytes_written, start, buffer.nbytes, buffer):
+            pass
+
+    def _iter_inflated(self, stack: Stack, bytes_written: int, start: int, size: int, buffer: memoryview):
+        """
+        Internal function. Generator decoding the bytes [start, start + size) of the data of a stack into buffer, which
+        may be smaller than size. Yields the number of decoded bytes in buffer whenever it is full and at the end, the
+        buffer is overwritten after that.
+
+        Compressed data is inflated block by block (limiting the output per step with max_length and continuing with
+        unconsumed_tail). If the stack was written with flush points, inflation starts at the last flush point before
+        start, otherwise at the beginning of the stream. flush_positions[i] is the offset in the logical compressed
+        stream where the (i+1)-th block of flush_block_size uncompressed bytes starts; each of these blocks can be
+        inflated on its own as raw deflate data.
+
+        :param stack: A Stack object containing all meta data
+        :param bytes_written: Number of bytes of the logical data stream
+        :param start: Offset of the first decoded byte
+        :param size: Number of decoded bytes
+        :param buffer: Writable byte buffer
+        """
+        capacity = buffer.nbytes
+        if stack._compression_type != 1:
+            # read directly into the buffer
+            for pos in range(start, start + size, capacity):
+                length = min(capacity, start + size - pos)
+                read = len(self._read_range(stack, pos, min(pos + length, bytes_written), buffer[:length]))
+                if read < length:
+                    raise RuntimeError('Stack data ended after {} of {} bytes.'.format(pos + read, start + size))
+                yield length
+            return
+
+        # find the flush point to start inflating from
+        flush_block = 0
+        flush_block_size = stack.footer.get('flush_block_size', 0)
+        flush_positions = stack.footer.get('flush_positions', ())
+        if flush_block_size > 0:
+            flush_block = min(start // flush_block_size, len(flush_positions))
+        if flush_block > 0:
+            stream_pos = int(flush_positions[flush_block - 1])
+            zobj = zlib.decompressobj(-zlib.MAX_WBITS)  # raw deflate data (no zlib header)
+        else:
+            stream_pos = 0
+            zobj = zlib.decompressobj()
+        skip = start - flush_block * flush_block_size  # decoded bytes before start that are discarded
+
+        # the compressed stream is only read up to the flush point after the last needed byte (if there is one)
+        stream_stop = bytes_written
+        if flush_block_size > 0:
+            end_block = -(-(start + size) // flush_block_size)  # first flush block that isn't needed
+            if 0 < end_block <= len(flush_positions):
+                stream_stop = min(int(flush_positions[end_block - 1]), bytes_written)
+
+        done = 0  # decoded bytes already yielded
+        fill = 0  # decoded bytes in the buffer
+        for block in self._iter_stream(stack, stream_pos, stream_stop, STREAM_BLOCK_SIZE):
+            while block and done + fill < size:
+                if skip > 0:
+                    skip -= len(zobj.decompress(block, min(skip, 4 * STREAM_BLOCK_SIZE)))
+                else:
+                    inflated = zobj.decompress(block, min(capacity - fill, size - done - fill, 4 * STREAM_BLOCK_SIZE))
+                    buffer[fill:fill + len(inflated)] = inflated
+                    fill += len(inflated)
+                    if fill == capacity or done + fill == size:
+                        yield fill
+                        done += fill
+                        fill = 0
+                block = zobj.unconsumed_tail
+            if done == size or zobj.eof:
+                break
+        if done < size:
+            raise RuntimeError('Stack data ended after {} of {} bytes.'.format(start + done + fill, start + size))
+
+    def _iter_blocks(self, stack: Stack, block_samples: int):
+        """
+        Internal function. Generator decoding the data of a stack sequentially into flat arrays of block_samples
+        samples each (in the order of the stored data). Only one block is decoded at a time, every block is a new
+        array.
+
+        :param stack: A Stack object containing all meta data
+        :param block_samples: Number of samples per block (samples_written should be a multiple of it)
+        """
+        try:
+            block = np.empty(block_samples, dtype=stack.data_type)
+            nbytes = stack.footer['samples_written'] * block.itemsize
+            if block.nbytes == 0 or nbytes == 0:
+                return
+            buffer = memoryview(block).cast('B')
+            for length in self._iter_inflated(stack, self._bytes_written(stack), 0, nbytes, buffer):
+                yield block[:length // block.itemsize].copy()
+        except Exception:  # not if the generator is closed early
+            self.close()
+            raise
+
+    def _read_stack_as(self, stack: Stack, dtype, convert) -> np.ndarray:
+        """
+        Internal function. Decodes the data of a stack block by block and converts each block into its part of a new
+        array, so that the data is never held in its original data type as a whole. Data that is already loaded or
+        memory mapped is converted block by block as well.
+
+        :param stack: A Stack object containing all meta data
+        :param dtype: Data type of the returned array
+        :param convert: Function converting a block of samples into an output block, convert(samples, out)
+        :return: Flat array with samples_written elements (in the order of the stored data)
+        """
+        try:
+            samples_written = stack.footer['samples_written']
+            array = np.empty(samples_written, dtype=dtype)
+            if samples_written == 0:
+                return array
+            block_samples = max(STREAM_BLOCK_SIZE // stack.data_type().itemsize, 1)
+            if stack._data is not None or (self._memory_map and self._is_mappable(stack)):
+                samples = np.transpose(stack.data).reshape(-1)
+                for pos in range(0, samples_written, block_samples):
+                    convert(samples[pos:pos + block_samples], array[pos:pos + block_samples])
+                return array
+
+            block = np.empty(min(block_samples, samples_written), dtype=stack.data_type)
+            pos = 0
+            for length in self._iter_inflated(stack, self._bytes_written(stack), 0, samples_written * block.itemsize,
+                                              memoryview(block).cast('B')):
+                count = length // block.itemsize
+                convert(block[:count], array[pos:pos + count])
+                pos += count
+            return array
         except:
             self.close()
             raise
 
+    def _inflate_stack_parallel(self, stack: Stack, bytes_written: int, workers: int, array: np.ndarray):
+        """
+        Internal function. Like _inflate_stack but for compressed stacks with flush points: the compressed stream is
+        split at the flush positions and the blocks (each flush_block_size uncompressed bytes) are inflated concurrently
+        on a thread pool (zlib releases the GIL), each directly into its slot of the preallocated array. The
+        compressed blocks are read sequentially, at most 2 * workers of them are held in memory at once.
+
+        :param stack: A Stack object containing all meta data
+        :param bytes_written: Number of bytes of the logical data stream
+        :param workers: Number of threads
+        :param array: Flat array with samples_written elements (see _allocate)
+        """
+        buffer = memoryview(array).cast('B')
+        size = buffer.nbytes
+        flush_block_size = stack.footer['flush_block_size']
+        # block i starts at compressed position stream_positions[i] and at uncompressed position i * flush_block_size
+        flush_positions = stack.footer['flush_positions']
+        stream_positions = [0] + flush_positions[flush_positions < bytes_written].tolist()
+        stream_positions = stream_positions[:max(1, -(-size // flush_block_size))]
+        stream_positions.append(bytes_written)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = deque()
+            for idx in range(len(stream_positions) - 1):
+                data = self._read_range(stack, stream_positions[idx], stream_positions[idx + 1])
+                start = idx * flush_block_size
+                stop = size if idx == len(stream_positions) - 2 else min(size, start + flush_block_size)
+                wbits = zlib.MAX_WBITS if idx == 0 else -zlib.MAX_WBITS  # only the first block has a zlib header
+                futures.append(executor.submit(_inflate_block, data, wbits, buffer[start:stop]))
+                if len(futures) >= 2 * workers:
+                    futures.popleft().result()
+            for future in futures:
+                future.result()
+
+    def _read_samples(self, stack: Stack, start: int, count: int) -> np.ndarray:
+        """
+        Internal function. Reads count samples of a stack starting at sample start (in the order of the stored data)
+        without reading the whole stack, using flush points if available.
+
+        :param stack: A Stack object containing all meta data
+        :param start: Index of the first sample
+        :param count: Number of samples
+        :return: Flat array with count elements
+        """
+        try:
+            array = np.empty(count, dtype=stack.data_type)
+            self._inflate_into(stack, self._bytes_written(stack), memoryview(array).cast('B'),
+                               start * array.itemsize)
+            return array
+        except:
+            self.close()
+            raise
+
+    def _read_stack_at_once(self, stack: Stack, bytes_written: int) -> np.ndarray:
+        """
+        Internal function. Reads the whole data stream of a stack, joins it and inflates it in one go. Needs memory for
+        the compressed, the joined and the decompressed bytes at once. Only used with File(..., streaming=False).
+
+        :param stack: A Stack object containing all meta data
+        :param bytes_written: Number of bytes of the logical data stream
+        :return: Flat array with samples_written elements
+        """
+        # read all chunks at once
+        if stack._compression_type == 1 and 'num_chunk_positions' in stack.footer:
+            # this is a bit heuristic and not documented but I don't want to read too much, the size of the uncompressed
+            # data plus a small overhead for the zip header that is also divisible by all data type sizes in bytes
+            bytes_written = min(stack.footer['samples_written'] * stack.data_type().itemsize + 16, bytes_written)
+        data = self._read_range(stack, 0, bytes_written)
+
+        # if compressed, uncompress
+        if stack._compression_type == 1:
+            zobj = zlib.decompressobj()
+            data = zobj.decompress(data)
+            # data = zlib.decompress(data) # that gave "zlib.error: Error -5 while decompressing data: incomplete or truncated stream" sometimes
+
+        # convert to numpy array
+        array = np.frombuffer(data, dtype=stack.data_type)
+        return array[:stack.footer['samples_written']]  # not sure if this is needed anymore
+
+    def _is_mappable(self, stack: Stack) -> bool:
+        """
+        Internal function. A stack can be memory mapped if it is uncompressed, not empty, completely written and stored
+        contiguously, i.e. every chunk starts at the same logical and file offset (relative to the data position).
+
+        :param stack: A Stack object containing all meta data
+        """
+        samples_written = stack.footer['samples_written']
+        if stack._compression_type != 0 or samples_written == 0 or samples_written != np.prod(stack.shape):
+            return False
+        if np.any(stack.footer['chunk_positions']['logical'] != stack.footer['chunk_positions']['file']):
+            return False
+        return stack._data_pos + samples_written * stack.data_type().itemsize <= self._file_size
+
     def __del__(self):
         """
         Make sure that the file is closed upon deletion.
@@ -456,32 +1107,579 @@ class File:
         self.close()
 
 
+class _BufferedReader:
+    """
+    For internal use only. Reads from a file through a read-ahead buffer, so that the many small values of headers and
+    footers are decoded from a memoryview of a few large reads instead of reading each value on its own.
+    """
+
+    def __init__(self, read_at, pos: int, buffer_size: int):
+        """
+        :param read_at: Function reading length bytes at a file position, read_at(pos, length) -> bytes
+        :param pos: Initial position
+        :param buffer_size: Minimal number of bytes read at once
+        """
+        self._read_at = read_at
+        self._buffer_size = buffer_size
+        self._buffer = memoryview(b'')
+        self._buffer_pos = pos  # file position of the buffer
+        self._offset = 0  # current position within the buffer
+
+    def tell(self) -> int:
+        return self._buffer_pos + self._offset
+
+    def seek(self, pos: int):
+        if self._buffer_pos <= pos <= self._buffer_pos + len(self._buffer):
+            self._offset = pos - self._buffer_pos
+        else:
+            self._buffer = memoryview(b'')
+            self._buffer_pos = pos
+            self._offset = 0
+
+    def read(self, length: int) -> memoryview:
+        """
+        Returns the next length bytes (or less at the end of the file).
+        """
+        if self._offset + length > len(self._buffer):
+            # refill, keeping the not yet consumed rest of the buffer
+            pos = self.tell()
+            rest = self._buffer[self._offset:]
+            data = self._read_at(pos + len(rest), max(length - len(rest), self._buffer_size))
+            self._buffer = memoryview(rest.tobytes() + data if len(rest) > 0 else data)
+            self._buffer_pos = pos
+            self._offset = 0
+        data = self._buffer[self._offset:self._offset + length]
+        self._offset += len(data)
+        return data
+
+    def read_string(self, length: int = None) -> str:
+        """
+        :param length: Number of bytes to read, if none is given, reads the length first.
+        :return: Decoded string
+        """
+        if length is None:
+            length = int_unpack(self.read(int_len))[0]
+        data = self.read(length)
+        if len(data) < length:
+            raise RuntimeError('Unexpected end of file.')
+        string = data.tobytes()
+        try:
+            string = string.decode('utf-8')
+        except UnicodeDecodeError:
+            # fallback encoding for very old (<2008) files
+            string = string.decode('iso-8859-1')
+
+        return string
+
+
+def _inflate_block(data: bytes, wbits: int, buffer: memoryview):
+    """
+    For internal use only. Inflates a block of compressed data that can be inflated on its own (the beginning of the
+    stream or a flush point) into buffer, which must be filled completely.
+    """
+    zobj = zlib.decompressobj(wbits)
+    pos = 0
+    size = buffer.nbytes
+    while data and pos < size:
+        inflated = zobj.decompress(data, min(size - pos, 4 * STREAM_BLOCK_SIZE))
+        buffer[pos:pos + len(inflated)] = inflated
+        pos += len(inflated)
+        data = zobj.unconsumed_tail
+    if pos < size:
+        raise RuntimeError('Compressed block ended after {} of {} bytes.'.format(pos, size))
+
+
 class Stack:
     """
     A Stack class, holds attributes about stacks
     """
 
+    __slots__ = ('file', 'format_version', 'rank', 'shape', 'lengths', 'offsets', 'data_type', 'name', 'description',
+                 'dimensionality', 'footer', 'labels', 'col_positions', 'col_labels', 'metadata', 'tag_dictionary',
+                 'si_value', 'si_dimensions', '_compression_type', '_data_length', '_data_pos', '_footer_pos',
+                 '_footer_read', '_data', '__weakref__')
+
+    # attributes stored in the stack index (see File._write_index)
+    _index_attributes = ('format_version', 'rank', 'shape', 'lengths', 'offsets', 'name', 'description',
+                         'dimensionality', 'footer', '_compression_type', '_data_length', '_data_pos', '_footer_pos')
+
+    # attributes that are only available after the stack footer has been read
+    _footer_attributes = frozenset(('footer', 'labels', 'col_positions', 'col_labels', 'metadata', 'tag_dictionary',
+                                    'si_value', 'si_dimensions'))
+
     def __init__(self, file: File):
         """
         Initialize with a File object.
         """
         self.file = file
         self._data = None
+        self._footer_read = False
 
     def __getattr__(self, name: str):
         """
         Computes a few convenience attributes on the fly as well as lazy loading of the data
-        :param name: either "pixel_sizes" or "data"
+        :param name: either "pixel_sizes", "data" or one of the attributes read from the stack footer
         """
-        if name == 'pixel_sizes':
+        if name in Stack._footer_attributes:
+            if not self._footer_read:
+                # first time a footer attribute is accessed, read the footer
+                self.file._read_footer(self)
+                return getattr(self, name)
+        elif name == 'pixel_sizes':
             # if a dimension is 0, the pixel size is NaN in that direction
             pixel_sizes = [length / n if n > 0 else math.nan for length, n in zip(self.lengths, self.shape)]
             return pixel_sizes
         elif name == 'data':
-            if self._data is None:
-                # first time data is called, load it
+            data = self._data
+            if data is None:
+                # first time data is called (or after it was released), load it
+                data_cache.count_miss()
                 self.file._read_stack(self)
-            return self._data
+                data = self._data
+            else:
+                data_cache.count_hit(self)
+            return data
+
+    def as_array(self, order: str = 'imspector') -> np.ndarray:
+        """
+        Returns the stack data in the given order of dimensions.
+
+        :param order: 'imspector' for the same as data (dimensions as in shape, e.g. [X, Y, Z, T]) or 'native' for
+            the order in which the data is stored (reversed shape, e.g. [T, Z, Y, X]), which is C-contiguous and
+            corresponds to numpy.transpose(data) (no data is copied in both cases)
+        """
+        if order == 'imspector':
+            return self.data
+        elif order == 'native':
+            return np.transpose(self.data)
+        raise ValueError('Unknown order {}.'.format(order))
+
+    def data_as(self, dtype=np.uint8, scale: float = 1, offset: float = 0, clip=None, lut=None,
+                order: str = 'imspector') -> np.ndarray:
+        """
+        Returns the stack data converted to another data type, e.g. 8 bit for saving images. If the data isn't loaded
+        yet, it is converted block by block while it is inflated, so only the converted array is held in memory (not
+        the data in its original data type and float copies of it). The result is not kept (data is not loaded).
+
+        Every value becomes lut[value] if a lookup table is given (integer data only, values outside the table are
+        clipped to its ends), otherwise value * scale + offset clipped to clip and then cast to dtype (truncating like
+        numpy astype).
+
+        :param dtype: Data type of the result
+        :param scale: Factor applied to all values
+        :param offset: Added to all values after scaling
+        :param clip: (minimum, maximum) of the scaled values (None for no bound on one side), default is the range of
+            dtype for integer types (values above 255 become 255 for uint8), False for no clipping
+        :param lut: Lookup table (converted to dtype), replaces scale, offset and clip
+        :param order: 'imspector' or 'native' (see as_array)
+        """
+        dtype = np.dtype(dtype)
+        if lut is not None:
+            if not np.issubdtype(self.data_type, np.integer):
+                raise ValueError('A lookup table needs integer data, not {}.'.format(self.data_type.__name__))
+            lut = np.asarray(lut, dtype=dtype)
+        elif clip is None and np.issubdtype(dtype, np.integer):
+            clip = (np.iinfo(dtype).min, np.iinfo(dtype).max)
+        array = self.file._read_stack_as(self, dtype, lambda samples, out: _convert(samples, out, scale, offset,
+                                                                                    clip or None, lut))
+        array = np.reshape(array, self.shape[::-1])
+        if order == 'native':
+            return array
+        elif order == 'imspector':
+            return np.transpose(array)
+        raise ValueError('Unknown order {}.'.format(order))
+
+    def iter_planes(self, axis: int = 2, order: str = 'imspector'):
+        """
+        Generator over the planes of the stack, yielding (index, plane) with plane the same as data[(...,) + index].
+        Planes consist of the dimensions before axis (2D XY planes by default), index contains the positions in all
+        following dimensions and the first of them varies fastest (the order in which the data is stored). If the data
+        isn't loaded yet, it is inflated incrementally and only one plane is decoded at a time, so arbitrarily long
+        acquisitions can be processed with the memory needed for a single plane. Otherwise the planes are views of
+        the loaded or memory mapped data.
+
+        :param axis: First dimension that is iterated over, e.g. 3 yields XYZ volumes of a XYZT stack
+        :param order: 'imspector' or 'native' for the planes (see as_array)
+        """
+        if order not in ('imspector', 'native'):
+            raise ValueError('Unknown order {}.'.format(order))
+        axis = min(max(axis, 0), len(self.shape))
+        plane_shape = tuple(self.shape[:axis])
+        indices = np.ndindex(*self.shape[axis:][::-1])  # reversed, so that the first dimension varies fastest
+        if self._data is not None or (self.file._memory_map and self.file._is_mappable(self)):
+            data = self.data
+            planes = (data[(Ellipsis,) + index[::-1]] for index in np.ndindex(*self.shape[axis:][::-1]))
+        else:
+            planes = (np.transpose(np.reshape(block, plane_shape[::-1]))
+                      for block in self.file._iter_blocks(self, int(np.prod(plane_shape))))
+        for index, plane in zip(indices, planes):
+            yield index[::-1], np.transpose(plane) if order == 'native' else plane
+
+    def project(self, kinds=('max',), axis: int = 2, order: str = 'imspector') -> dict:
+        """
+        Projections of the stack along all dimensions from axis on, e.g. the maximum intensity projection of a XYZ
+        stack along Z or of a XYZT stack along Z and T. All requested kinds are computed in a single pass over the
+        planes (see iter_planes) with running accumulators, so if the data isn't loaded, only the current plane and
+        the accumulators are held in memory.
+
+        :param kinds: Any of 'max', 'min', 'sum', 'mean' and 'std' (population standard deviation, computed with
+            Welford's method)
+        :param axis: First dimension that is projected along
+        :param order: 'imspector' or 'native' for the projections (see as_array)
+        :return: Dictionary of the projections by kind (max and min have the data type of the stack, the others are
+            float64)
+        """
+        kinds = set(kinds)
+        unknown = kinds - {'max', 'min', 'sum', 'mean', 'std'}
+        if unknown:
+            raise ValueError('Unknown projections {}.'.format(', '.join(sorted(unknown))))
+
+        projections = {}
+        count = 0
+        for _, plane in self.iter_planes(axis, order):
+            count += 1
+            if count == 1:
+                # initialize the accumulators with the first plane
+                if 'max' in kinds:
+                    projections['max'] = np.array(plane)
+                if 'min' in kinds:
+                    projections['min'] = np.array(plane)
+                if 'sum' in kinds or 'mean' in kinds:
+                    total = plane.astype(np.float64)
+                if 'std' in kinds:
+                    mean = plane.astype(np.float64)
+                    squares = np.zeros(plane.shape)  # sum of squared differences from the mean
+                continue
+            if 'max' in kinds:
+                np.maximum(projections['max'], plane, out=projections['max'])
+            if 'min' in kinds:
+                np.minimum(projections['min'], plane, out=projections['min'])
+            if 'sum' in kinds or 'mean' in kinds:
+                total += plane
+            if 'std' in kinds:
+                delta = plane - mean
+                mean += delta / count
+                delta *= plane - mean
+                squares += delta
+        if count == 0:
+            raise ValueError('Stack {} has no planes to project.'.format(self.name))
+
+        if 'sum' in kinds:
+            projections['sum'] = total
+        if 'mean' in kinds:
+            projections['mean'] = total / count
+        if 'std' in kinds:
+            projections['std'] = np.sqrt(squares / count)
+        return projections
+
+    def release(self):
+        """
+        Releases the loaded data of this stack (it is loaded again when data is accessed the next time).
+        """
+        data_cache.remove(self)
+        self._data = None
+
+    def digest(self) -> str:
+        """
+        Returns a hash of the stored data of this stack (the compressed bytes for compressed stacks, nothing is
+        inflated) and of its shape and data type. Identical stacks have the same digest, also in different or renamed
+        files, so it can be used as content address of results computed from the data (see derived_cache.py).
+        """
+        return self.file._digest(self)
+
+    def load(self, workers: int = None, out=None, scratch_dir: str = None) -> np.ndarray:
+        """
+        (Re-)loads the stack data and returns it (afterwards also available as data). Compressed stacks written with
+        flush points are inflated on a thread pool, otherwise this is the same as accessing data.
+
+        The data can be decoded into a caller supplied buffer or, for stacks larger than the available memory, into a
+        temporary file that is memory mapped (data is then a view of a NumPy memmap).
+
+        :param workers: Number of threads, default is the number of CPUs
+        :param out: Writable, contiguous buffer (e.g. a NumPy array in native order, see as_array) of at least
+            samples_written times the item size of data_type bytes, data is then a view of it
+        :param scratch_dir: Directory for the temporary file (default is the scratch_dir given to File)
+        """
+        self.file._read_stack(self, workers if workers is not None else os.cpu_count() or 1, out, scratch_dir)
+        return self._data
+
+    def read(self, index=Ellipsis) -> np.ndarray:
+        """
+        Reads part of the stack data, the result is the same as stack.data[index]. If the data has not been loaded yet,
+        only the planes covering the requested region are read and inflated (starting at the nearest flush point if the
+        stack was written with flush points), so single planes or time points can be read from large stacks. Integer
+        indices of the last dimensions narrow the region most.
+
+        Can also be used as stack[index], e.g. stack[:, :, 5] for the 6th XY plane of a XYZ stack.
+
+        :param index: anything that can index stack.data (integers, slices, Ellipsis), other indices read all data
+        """
+        normalized_index = _normalize_index(index, self.shape)
+        if self._data is not None or normalized_index is None or (self.file._memory_map and
+                                                                   self.file._is_mappable(self)):
+            return self.data[index]
+
+        # empty selections don't need any data
+        shape = [len(range(n)[value]) for n, value in zip(self.shape, normalized_index) if isinstance(value, slice)]
+        if 0 in shape:
+            return np.empty(shape, dtype=self.data_type)
+
+        # strides of the dimensions (in samples, the first dimension varies fastest)
+        strides = [int(np.prod(self.shape[:axis])) for axis in range(len(self.shape))]
+
+        # fixed integer indices of the last dimensions select a single contiguous block of planes
+        start = 0
+        axis = len(self.shape) - 1
+        while axis > 0 and isinstance(normalized_index[axis], int):
+            start += normalized_index[axis] * strides[axis]
+            axis -= 1
+
+        # range of selected positions in this dimension
+        if isinstance(normalized_index[axis], int):
+            positions = range(normalized_index[axis], normalized_index[axis] + 1)
+        else:
+            positions = range(self.shape[axis])[normalized_index[axis]]
+        first = min(positions[0], positions[-1])
+        count = abs(positions[-1] - positions[0]) + 1
+
+        # read and reshape these planes (with reversed shape and then reverse order of dimensions)
+        array = self.file._read_samples(self, start + first * strides[axis], count * strides[axis])
+        array = np.reshape(array, (tuple(self.shape[:axis]) + (count,))[::-1])
+        array = np.transpose(array)
+
+        # index relative to the planes read
+        if isinstance(normalized_index[axis], int):
+            relative_index = 0
+        else:
+            stop = positions.stop - first
+            relative_index = slice(positions.start - first, stop if stop >= 0 else None, positions.step)
+        return array[tuple(normalized_index[:axis]) + (relative_index,)]
+
+    def __getitem__(self, index) -> np.ndarray:
+        """
+        Same as read(index).
+        """
+        return self.read(index)
+
+    def as_lazy_array(self, axis: int = 2, order: str = 'imspector') -> LazyArray:
+        """
+        Returns a lazy, chunked array of the stack data (see LazyArray), e.g. for dask:
+        dask.array.from_array(lazy, chunks=lazy.chunks)
+
+        :param axis: Chunks are planes of the dimensions before axis (see iter_planes)
+        :param order: 'imspector' or 'native' (see as_array)
+        """
+        return LazyArray(self, axis, order)
+
+
+class LazyArray:
+    """
+    A lazy, chunked, read-only array of the data of a stack (see Stack.as_lazy_array). Nothing is read until it is
+    indexed, then only the planes covering the index are read (see Stack.read), numpy.asarray(lazy) reads everything.
+    Loaded stack data is used if available, otherwise the read data is not kept. Compressed stacks without flush
+    points can only be inflated from the beginning, so these are loaded completely (as stack.data, tracked by
+    data_cache) on the first access instead of inflating the beginning of the stack again for every chunk.
+
+    The chunks are planes (one chunk per index of the dimensions from axis on). For compressed stacks with flush points
+    they are lined up with the flush blocks, which can be read and inflated independently: planes larger than a flush
+    block are split into bands of whole flush blocks, smaller planes are combined along the next dimension. It can be
+    wrapped as dask array with dask.array.from_array(lazy, chunks=lazy.chunks) and computed with the threaded scheduler
+    (reading from a file is thread-safe).
+
+    Attributes:
+        - shape, dtype, ndim, size, nbytes
+        - chunks (shape of one chunk)
+        - stack
+    """
+
+    def __init__(self, stack: Stack, axis: int = 2, order: str = 'imspector'):
+        if order not in ('imspector', 'native'):
+            raise ValueError('Unknown order {}.'.format(order))
+        self.stack = stack
+        self._order = order
+        self.dtype = np.dtype(stack.data_type)
+        shape = tuple(stack.shape)
+        axis = min(max(axis, 1), len(shape))
+        chunks = list(shape[:axis]) + [1] * (len(shape) - axis)
+        flush_block_size = stack.footer.get('flush_block_size', 0)
+        has_flush_points = flush_block_size > 0 and len(stack.footer.get('flush_positions', ())) > 0
+        self._load = stack._compression_type == 1 and not has_flush_points
+        if stack._compression_type == 1 and has_flush_points:
+            plane_bytes = int(np.prod(shape[:axis])) * self.dtype.itemsize
+            if plane_bytes > flush_block_size:
+                # bands of whole flush blocks along the last dimension of the planes
+                band_bytes = int(np.prod(shape[:axis - 1])) * self.dtype.itemsize
+                chunks[axis - 1] = max(min(flush_block_size // max(band_bytes, 1), shape[axis - 1]), 1)
+            elif axis < len(shape):
+                # as many planes as fit into a flush block
+                chunks[axis] = max(min(flush_block_size // max(plane_bytes, 1), shape[axis]), 1)
+        if order == 'native':
+            shape, chunks = shape[::-1], chunks[::-1]
+        self.shape = shape
+        self.chunks = tuple(chunks)
+        self.ndim = len(shape)
+        self.size = int(np.prod(shape))
+        self.nbytes = self.size * self.dtype.itemsize
+
+    def __getitem__(self, index) -> np.ndarray:
+        if self._load:
+            return self.stack.as_array(self._order)[index]
+        normalized_index = _normalize_index(index, self.shape)
+        if normalized_index is None:
+            # other indices (e.g. integer arrays) are applied to all data (without loading it into the stack)
+            return np.asarray(self)[index]
+        if self._order == 'imspector':
+            return self.stack.read(tuple(normalized_index))
+        return np.transpose(self.stack.read(tuple(normalized_index[::-1])))
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        array = self[...]
+        return array if dtype is None else array.astype(dtype)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __repr__(self) -> str:
+        return 'LazyArray(stack={!r}, shape={}, dtype={}, chunks={})'.format(self.stack.name, self.shape, self.dtype,
+                                                                             self.chunks)
+
+
+class DataCache:
+    """
+    Keeps track of the loaded data of all stacks (in all files) in least recently used order and releases the data
+    of the least recently used stacks when the loaded data exceeds max_bytes (None means no limit). Memory mapped data
+    doesn't count. The stacks themselves are only weakly referenced.
+
+    There is one process wide instance: obf_support.data_cache, e.g. obf_support.data_cache.max_bytes = 8 * 2**30
+
+    Attributes:
+        - max_bytes (setting it releases data if necessary)
+        - nbytes (bytes of loaded data)
+        - hits, misses, evictions (counters, reset with reset_counters())
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()  # id(stack) -> (weak reference to stack, number of bytes)
+        self._lock = threading.RLock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes: int):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def add(self, stack: Stack, nbytes: int):
+        """
+        Registers the just loaded data of a stack as most recently used, releasing other data if needed.
+        """
+        with self._lock:
+            self._pop(id(stack))
+            key = id(stack)
+            self._entries[key] = (weakref.ref(stack, lambda _: self._pop(key)), nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def remove(self, stack: Stack):
+        """
+        Forgets a stack (without releasing its data).
+        """
+        with self._lock:
+            self._pop(id(stack))
+
+    def count_hit(self, stack: Stack):
+        with self._lock:
+            self.hits += 1
+            if id(stack) in self._entries:
+                self._entries.move_to_end(id(stack))
+
+    def count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def _pop(self, key: int):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry[1]
+            return entry
+
+    def _evict(self):
+        # always keeps the most recently used data
+        while self._max_bytes is not None and self.nbytes > self._max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            stack = self._pop(key)[0]()
+            if stack is not None:
+                stack._data = None
+            self.evictions += 1
+
+    def __str__(self) -> str:
+        return '{} stacks, {} bytes (max {}), {} hits, {} misses, {} evictions'.format(
+            len(self._entries), self.nbytes, self._max_bytes, self.hits, self.misses, self.evictions)
+
+
+# the process wide data cache
+data_cache = DataCache()
+
+
+def _convert(samples: np.ndarray, out: np.ndarray, scale: float, offset: float, clip: tuple, lut: np.ndarray):
+    """
+    For internal use only. Converts a block of samples into out (see Stack.data_as).
+    """
+    if lut is not None:
+        np.take(lut, samples, out=out, mode='clip')
+        return
+    if scale != 1 or offset != 0:
+        samples = samples * np.float64(scale)
+        samples += offset
+        if clip is not None:
+            np.clip(samples, clip[0], clip[1], out=samples)
+    elif clip is not None:
+        samples = np.clip(samples, clip[0], clip[1])
+    np.copyto(out, samples, casting='unsafe')
+
+
+def _normalize_index(index, shape: tuple):
+    """
+    For internal use only. Expands an index for an array of the given shape to a list with an integer (non-negative) or
+    a slice for every dimension.
+
+    :return: List of integers and slices or None if the index contains anything else (or is out of bounds).
+    """
+    if not isinstance(index, tuple):
+        index = (index,)
+    ellipses = [value is Ellipsis for value in index]
+    if sum(ellipses) > 1:
+        return None
+    if any(ellipses):
+        position = ellipses.index(True)
+        index = index[:position] + (slice(None),) * (len(shape) - len(index) + 1) + index[position + 1:]
+    index = list(index) + [slice(None)] * (len(shape) - len(index))
+    if len(index) != len(shape):
+        return None
+    for axis, value in enumerate(index):
+        if isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+            value = int(value)
+            if value < 0:
+                value += shape[axis]
+            if not 0 <= value < shape[axis]:
+                return None
+            index[axis] = value
+        elif not isinstance(value, slice):
+            return None
+    return index
 
 
 class SIUnit:
@@ -490,6 +1688,8 @@ class SIUnit:
     exponents = Meters (M), Kilograms (KG), Seconds (S), Amperes (A), Kelvin (K), Moles (MOL), Candela (CD), Radian (R), Steradian (SR)
     """
 
+    __slots__ = ('_exponents', 'scalefactor')
+
     unitnames = ['m', 'kg', 's', 'A', 'K', 'mol', 'CD', 'R', 'SR']
 
     def __init__(self, values):
@@ -498,11 +1698,16 @@ class SIUnit:
         """
         if len(values) != 19:
             raise RuntimeError('SI unit needs 19 values to initialize.')
-        self.exponents = []
-        for i in range(9):
-            self.exponents.append(Fraction(values[i * 2], values[i * 2 + 1]))
+        self._exponents = np.array(values[:18], dtype=np.int32).reshape(9, 2)  # numerator, denominator
         self.scalefactor = values[18]
 
+    @property
+    def exponents(self) -> list[Fraction]:
+        """
+        Exponents of the units as list of Fraction (numerator, denominator).
+        """
+        return [Fraction(int(numerator), int(denominator)) for numerator, denominator in self._exponents]
+
     def __str__(self) -> str:
         """
         Some kind of meaningful string representation. Could still be improved.
@@ -0,0 +1,592 @@
+"""
+  Benchmarks for the OBF file format reader implementation in obf_support.py. Writes a synthetic OBF file (or uses an
+  existing ".obf"/".msr" file given as first command line argument) and compares different ways of reading it.
+
+  The synthetic files are written by write_obf(), a small writer that supports just enough of the OBF format (stack
+  format version 6 with compression, flush points and chunks) to exercise the reader.
+
+  Also benchmarks the exporters in obf_export.py.
+"""
+
+import itertools
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import obf_export
+import obf_support
+
+
+def _pack_string(string: str) -> bytes:
+    """
+    Length prefixed utf-8 string as used in OBF files.
+    """
+    data = string.encode('utf-8')
+    return struct.pack('<I', len(data)) + data
+
+
+def _compress(data: bytes, flush_block_size: int):
+    """
+    Deflates data, with a full flush every flush_block_size bytes of uncompressed data (if flush_block_size > 0).
+
+    :return: compressed data, flush positions
+    """
+    zobj = zlib.compressobj()
+    compressed = []
+    flush_positions = []
+    length = 0
+    step = flush_block_size if flush_block_size > 0 else max(len(data), 1)
+    for pos in range(0, len(data), step):
+        compressed.append(zobj.compress(data[pos:pos + step]))
+        if flush_block_size > 0 and pos + step < len(data):
+            compressed.append(zobj.flush(zlib.Z_FULL_FLUSH))
+            length += len(compressed[-2]) + len(compressed[-1])
+            flush_positions.append(length)
+        else:
+            length += len(compressed[-1])
+    compressed.append(zobj.flush())
+    return b''.join(compressed), flush_positions
+
+
+def write_obf(file_path: str, stacks: list):
+    """
+    Writes a synthetic OBF file (file format version 2, stack format version 6).
+
+    :param file_path: path of the OBF file
+    :param stacks: list of dictionaries with keys 'name', 'data' (NumPy array in the same order as Stack.data) and
+        optionally 'compression' (bool), 'flush_block_size' (int, uncompressed bytes between flush points) and
+        'chunk_size' (int, if > 0 the data stream is split into chunks of this size with gaps of chunk_gap bytes in
+        between as in interleaved acquisitions)
+    """
+    description = b'synthetic OBF file'
+    output = bytearray(struct.pack(obf_support.file_header_fmt, obf_support.FILE_MAGIC_HEADER, 2, 0, len(description)))
+    output += description
+    output += struct.pack(obf_support.long_fmt, len(output) + obf_support.long_len)
+    output += _pack_string('')  # no file meta data
+    next_stack_pos_offset = 14  # offset of first_stack_pos in the file header
+
+    for stack in stacks:
+        array = np.asarray(stack['data'])
+        rank = array.ndim
+        data = np.ascontiguousarray(np.transpose(array)).tobytes()
+        compression = stack.get('compression', True)
+        flush_positions = []
+        if compression:
+            data, flush_positions = _compress(data, stack.get('flush_block_size', 0))
+
+        # split the data stream into chunks separated by gaps
+        chunk_size = stack.get('chunk_size', 0)
+        chunk_gap = stack.get('chunk_gap', 64)
+        chunk_positions = []
+        if chunk_size > 0:
+            chunks = []
+            disk_pos = 0
+            for pos in range(0, len(data), chunk_size):
+                if pos > 0:
+                    chunks.append(b'\x00' * chunk_gap)
+                    disk_pos += chunk_gap
+                    chunk_positions.append((pos, disk_pos))
+                chunks.append(data[pos:pos + chunk_size])
+                disk_pos += len(chunks[-1])
+            data = b''.join(chunks)
+
+        name = stack['name'].encode('utf-8')
+        description = b''
+        header = np.zeros((), dtype=obf_support.stack_header_dtype)
+        header['magic_header'] = obf_support.STACK_MAGIC_HEADER
+        header['format_version'] = 6
+        header['rank'] = rank
+        header['shape'] = 1
+        header['shape'][:rank] = array.shape
+        header['lengths'][:rank] = [1e-8 * n for n in array.shape]
+        header['data_type'] = obf_support.omas_data_type_codes[array.dtype.type]
+        header['compression_type'] = int(compression)
+        header['compression_level'] = 6
+        header['name_length'] = len(name)
+        header['description_length'] = len(description)
+        header['data_length'] = len(data)
+        struct.pack_into(obf_support.long_fmt, output, next_stack_pos_offset, len(output))
+        next_stack_pos_offset = len(output) + obf_support.stack_header_len - obf_support.long_len
+        output += header.tobytes()
+        output += name + description + data
+
+        # stack footer (with micrometer as unit of all dimensions)
+        metadata = b''
+        footer_dtype = obf_support.stack_footer_dtype(6)
+        footer = np.zeros((), dtype=footer_dtype)
+        footer['footer_length'] = footer_dtype.itemsize
+        footer['metadata_length'] = len(metadata)
+        for unit in [footer['si_value']] + list(footer['si_dimensions']):
+            unit['exponents'][:, 1] = 1
+            unit['exponents'][0, 0] = 1
+            unit['scalefactor'] = 1e-6
+        footer['num_flush_points'] = len(flush_positions)
+        footer['flush_block_size'] = stack.get('flush_block_size', 0)
+        footer['stack_end_disk'] = len(data)
+        footer['min_format_version'] = 6
+        footer['stack_end_used_disk'] = len(data)
+        footer['samples_written'] = array.size
+        footer['num_chunk_positions'] = len(chunk_positions)
+        output += footer.tobytes()
+        output += b''.join(_pack_string('') for _ in range(rank))  # labels
+        output += metadata
+        output += struct.pack('<{}Q'.format(len(flush_positions)), *flush_positions)
+        output += b''.join(struct.pack('<2Q', *position) for position in chunk_positions)
+
+    with open(file_path, 'wb') as file:
+        file.write(output)
+
+
+def synthetic_image(shape: tuple, data_type=np.uint16) -> np.ndarray:
+    """
+    Smooth, noisy test image (compresses similar to real data).
+    """
+    rng = np.random.default_rng(0)
+    grid = np.meshgrid(*[np.linspace(0, 4 * np.pi, n) for n in shape], indexing='ij')
+    image = 100 * (2 + np.sin(sum(grid))) + rng.poisson(10, shape)
+    return image.astype(data_type)
+
+
+def measure(function, repeats: int = 3, trace_memory: bool = True):
+    """
+    Calls function repeats times and returns the best wall time and the peak of traced memory allocations (tracing
+    slows down code with many small allocations, so it can be switched off).
+    """
+    best = float('inf')
+    peak = 0
+    for _ in range(repeats):
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+        if trace_memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    return best, peak
+
+
+def benchmark_read(file_path: str):
+    """
+    Compares reading all stacks of a file all at once with streaming them into a preallocated array or into a memory
+    mapped temporary file (the traced memory doesn't include the mapped pages).
+    """
+    def read(**kwargs):
+        obf = obf_support.File(file_path, memory_map=False, **kwargs)
+        for stack in obf.stacks:
+            stack.data
+        obf.close()
+
+    print('reading stack data of {}'.format(file_path))
+    for label, kwargs in (('at once', {'streaming': False}), ('streaming', {'streaming': True}),
+                          ('scratch file', {'scratch_dir': tempfile.gettempdir()})):
+        seconds, peak = measure(lambda: read(**kwargs))
+        print('  {:<12} {:8.3f} s, peak memory {:8.1f} MB'.format(label, seconds, peak / 1e6))
+
+
+def benchmark_parallel_inflate(file_path: str):
+    """
+    Compares inflating the stacks of a file serially with inflating the blocks between flush points on a thread pool.
+    """
+    def load(workers):
+        obf = obf_support.File(file_path, memory_map=False)
+        for stack in obf.stacks:
+            stack.load(workers=workers)
+        obf.close()
+
+    print('inflating stack data of {} in parallel'.format(file_path))
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        seconds, _ = measure(lambda: load(workers), trace_memory=False)
+        print('  {:>2} workers {:8.3f} s'.format(workers, seconds))
+
+
+def benchmark_open(file_path: str):
+    """
+    Compares opening a file (parsing all headers) reading every value on its own, reading larger buffers and using
+    the stack index file (the first of the repetitions writes the index).
+    """
+    def open_file(**kwargs):
+        obf_support.File(file_path, **kwargs).close()
+
+    print('opening {}'.format(file_path))
+    for label, kwargs in (('unbuffered', {'buffer_size': 0}), ('buffered', {}), ('index', {'use_index': True})):
+        seconds, _ = measure(lambda: open_file(**kwargs), repeats=10, trace_memory=False)
+        print('  {:<12} {:8.2f} ms'.format(label, seconds * 1e3))
+
+
+def benchmark_stack_table(file_path: str):
+    """
+    Compares selecting stacks by dimensionality, data type and name with a loop over the stacks and with a vectorized
+    query on File.stack_table.
+    """
+    obf = obf_support.File(file_path)
+
+    def select_loop():
+        return [stack for stack in obf.stacks
+                if stack.dimensionality == 2 and stack.data_type == np.uint16 and stack.name.startswith('Channel 1')]
+
+    def select_table():
+        table = obf.stack_table
+        mask = ((table['dimensionality'] == 2) & (table['data_type'] == obf_support.omas_data_type_codes[np.uint16]) &
+                np.char.startswith(table['name'], 'Channel 1'))
+        return [obf.stacks[i] for i in np.flatnonzero(mask)]
+
+    print('selecting stacks of {}'.format(file_path))
+    select_table()  # builds the table
+    for label, select in (('loop', select_loop), ('stack_table', select_table)):
+        seconds, _ = measure(select, repeats=10, trace_memory=False)
+        print('  {:<12} {:8.3f} ms, {} stacks'.format(label, seconds * 1e3, len(select())))
+    obf.close()
+
+
+def benchmark_orientation(file_path: str):
+    """
+    Compares the typical processing of a script (percentile, scaling, conversion to 8 bit) on the data in Imspector
+    order (strided, as stack.data), after numpy.transpose(stack.data) and in native order (stack.as_array('native')).
+    """
+    def process(array):
+        upper = np.percentile(array, 99.8)
+        enhanced = array * (255 / upper)
+        enhanced[enhanced > 255] = 255
+        return np.ascontiguousarray(enhanced.astype(np.uint8))
+
+    obf = obf_support.File(file_path)
+    stack = obf.stacks[0]
+    stack.data
+    print('processing stack data of {}'.format(file_path))
+    for label, get_array in (('imspector', lambda: stack.data), ('transposed', lambda: np.transpose(stack.data)),
+                             ('native', lambda: stack.as_array(order='native'))):
+        seconds, peak = measure(lambda: process(get_array()))
+        print('  {:<12} {:8.3f} s, peak memory {:8.1f} MB, C-contiguous {}'.format(
+            label, seconds, peak / 1e6, get_array().flags['C_CONTIGUOUS']))
+    obf.close()
+
+
+def benchmark_convert(file_path: str):
+    """
+    Compares loading the first stack and converting it to 8 bit like the scripts do (scaling, clipping at 255, casting)
+    with converting it block by block while inflating (Stack.data_as).
+    """
+    def load_and_convert():
+        obf = obf_support.File(file_path, memory_map=False)
+        array = obf.stacks[0].data * 2.5
+        array[array > 255] = 255
+        array = array.astype(np.uint8)
+        obf.close()
+        return array
+
+    def data_as():
+        obf = obf_support.File(file_path, memory_map=False)
+        array = obf.stacks[0].data_as(np.uint8, scale=2.5)
+        obf.close()
+        return array
+
+    print('converting stack data of {} to 8 bit'.format(file_path))
+    for label, convert in (('load+convert', load_and_convert), ('data_as', data_as)):
+        seconds, peak = measure(convert)
+        print('  {:<12} {:8.3f} s, peak memory {:8.1f} MB'.format(label, seconds, peak / 1e6))
+
+
+def benchmark_planes(file_path: str):
+    """
+    Compares computing the mean of every XY plane of the first stack from the loaded data with iterating over the
+    planes (Stack.iter_planes, inflating one plane at a time).
+    """
+    def from_data():
+        obf = obf_support.File(file_path, memory_map=False)
+        stack = obf.stacks[0]
+        means = [stack.data[(Ellipsis,) + index].mean() for index in np.ndindex(*stack.shape[2:])]
+        obf.close()
+        return means
+
+    def from_planes():
+        obf = obf_support.File(file_path, memory_map=False)
+        means = [plane.mean() for _, plane in obf.stacks[0].iter_planes()]
+        obf.close()
+        return means
+
+    print('iterating over the planes of {}'.format(file_path))
+    for label, iterate in (('data', from_data), ('iter_planes', from_planes)):
+        seconds, peak = measure(iterate)
+        print('  {:<12} {:8.3f} s, peak memory {:8.1f} MB'.format(label, seconds, peak / 1e6))
+
+
+def benchmark_projections(file_path: str):
+    """
+    Compares computing max, mean and std projections of the first stack with NumPy from the loaded data with a single
+    streaming pass (Stack.project).
+    """
+    def from_data():
+        obf = obf_support.File(file_path, memory_map=False)
+        data = obf.stacks[0].data
+        axes = tuple(range(2, data.ndim))
+        projections = {'max': data.max(axes), 'mean': data.mean(axes), 'std': data.std(axes)}
+        obf.close()
+        return projections
+
+    def streaming():
+        obf = obf_support.File(file_path, memory_map=False)
+        projections = obf.stacks[0].project(('max', 'mean', 'std'))
+        obf.close()
+        return projections
+
+    print('projecting {}'.format(file_path))
+    for label, project in (('data', from_data), ('project', streaming)):
+        seconds, peak = measure(project)
+        print('  {:<12} {:8.3f} s, peak memory {:8.1f} MB'.format(label, seconds, peak / 1e6))
+
+
+def validate_read(file_path: str):
+    """
+    Compares partial reads (stack[index]) of all stacks with indexing the loaded data, with and without memory mapping,
+    and checks that partial reads of stacks that are not memory mapped don't load (and keep) the whole data.
+    """
+    print('validating partial reads of {}'.format(file_path))
+    reference = obf_support.File(file_path, memory_map=False)
+    for memory_map in (True, False):
+        obf = obf_support.File(file_path, memory_map=memory_map)
+        for stack, expected in zip(obf.stacks, reference.stacks):
+            indices = [(Ellipsis,) + (idx,) * (stack.rank - 2) for idx in (0, -1)]
+            indices += [(slice(None), 3) + (slice(1, None, 2),) * (stack.rank - 2), (slice(7, 2, -2),)]
+            identical = all(np.array_equal(stack[index], expected.data[index]) for index in indices)
+            mapped = memory_map and obf._is_mappable(stack)
+            print('  {:<12} memory map {:d}: identical {}, whole data kept {} (expected {})'.format(
+                stack.name, memory_map, identical, stack._data is not None, mapped))
+        obf.close()
+    reference.close()
+
+
+def validate_chunked(file_path: str, expected: list):
+    """
+    Compares loading and partial reads (stack[index]) of stacks stored in chunks with the arrays they were written
+    from and shows how many bytes of the data streams were read (a full load reads exactly the bytes written).
+
+    :param expected: The arrays the stacks were written from (in the same order as Stack.data)
+    """
+    def count_reads(obf: obf_support.File) -> list:
+        # counts the bytes read from the logical data streams (all reads of stack data go through _read_range)
+        counter = [0]
+        read_range = obf._read_range
+
+        def counted(*args, **kwargs):
+            data = read_range(*args, **kwargs)
+            counter[0] += len(data)
+            return data
+        obf._read_range = counted
+        return counter
+
+    print('validating reads of chunked stacks in {}'.format(file_path))
+    obf = obf_support.File(file_path, memory_map=False)
+    for stack, array in zip(obf.stacks, expected):
+        chunks = len(stack.footer['chunk_positions'])
+        bytes_written = obf._bytes_written(stack)
+        for label, index in (('data', None), ('first plane', (Ellipsis,) + (0,) * (stack.rank - 2)),
+                             ('last plane', (Ellipsis,) + (-1,) * (stack.rank - 2))):
+            stack.release()
+            counter = count_reads(obf)
+            data = stack.data if index is None else stack[index]
+            del obf._read_range
+            identical = np.array_equal(data, array if index is None else array[index])
+            print('  {:<12} {:>4} chunks {:<12} identical {}, {:>10} of {:>10} bytes read'.format(
+                stack.name, chunks, label, identical, counter[0], bytes_written))
+    obf.close()
+
+
+def benchmark_lazy(file_path: str):
+    """
+    Compares summing the first stack from the loaded data with summing the chunks of the lazy array on a thread pool
+    (as dask.array.from_array(lazy, chunks=lazy.chunks).sum() would with the threaded scheduler).
+    """
+    def from_data():
+        obf = obf_support.File(file_path, memory_map=False)
+        total = obf.stacks[0].data.sum(dtype=np.float64)
+        obf.close()
+        return total
+
+    def from_chunks():
+        obf = obf_support.File(file_path, memory_map=False)
+        lazy = obf.stacks[0].as_lazy_array()
+        starts = itertools.product(*[range(0, n, c) for n, c in zip(lazy.shape, lazy.chunks)])
+        indices = [tuple(slice(s, s + c) for s, c in zip(start, lazy.chunks)) for start in starts]
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            total = sum(executor.map(lambda index: lazy[index].sum(dtype=np.float64), indices))
+        obf.close()
+        return total
+
+    print('summing chunks of {}'.format(file_path))
+    for label, compute in (('data', from_data), ('lazy chunks', from_chunks)):
+        seconds, peak = measure(compute)
+        print('  {:<12} {:8.3f} s, peak memory {:8.1f} MB'.format(label, seconds, peak / 1e6))
+
+
+def benchmark_metadata(file_path: str):
+    """
+    Measures opening a file and parsing all stack footers (including the flush point and chunk tables) and compares
+    the memory needed to store the flush point table of the first stack as tuple of Python ints with the NumPy array.
+    """
+    def parse_footers():
+        obf = obf_support.File(file_path)
+        for stack in obf.stacks:
+            stack.footer
+        obf.close()
+
+    print('parsing stack footers of {}'.format(file_path))
+    seconds, peak = measure(parse_footers, trace_memory=False)
+    _, peak = measure(parse_footers, repeats=1)
+    print('  {:<12} {:8.2f} ms, peak memory {:8.1f} MB'.format('footers', seconds * 1e3, peak / 1e6))
+
+    obf = obf_support.File(file_path)
+    flush_positions = obf.stacks[0].footer['flush_positions']
+    as_tuple = tuple(int(position) for position in flush_positions)
+    tuple_size = sys.getsizeof(as_tuple) + sum(sys.getsizeof(position) for position in as_tuple)
+    print('  {} flush points: tuple {:8.1f} MB, array {:8.1f} MB'.format(
+        len(flush_positions), tuple_size / 1e6, flush_positions.nbytes / 1e6))
+    obf.close()
+
+
+def benchmark_ome_zarr(file_path: str):
+    """
+    Writes the first stack as OME-Zarr image with a single and with several chunk writing threads. Peak memory is
+    compared to the size of the stack data.
+    """
+    def export(workers):
+        def write():
+            with tempfile.TemporaryDirectory() as directory:
+                obf = obf_support.File(file_path, memory_map=False)
+                obf_export.write_ome_zarr(obf.stacks[0], os.path.join(directory, 'image.ome.zarr'), chunks=(256, 256),
+                                          workers=workers)
+                obf.close()
+        return write
+
+    obf = obf_support.File(file_path)
+    nbytes = int(np.prod(obf.stacks[0].shape)) * np.dtype(obf.stacks[0].data_type).itemsize
+    obf.close()
+    print('writing {} as OME-Zarr (stack data {:.1f} MB)'.format(file_path, nbytes / 1e6))
+    for workers in sorted({1, os.cpu_count() or 1, 4}):
+        seconds, peak = measure(export(workers), repeats=1)
+        print('  {:>2} workers {:8.3f} s, peak memory {:8.1f} MB'.format(workers, seconds, peak / 1e6))
+
+
+def benchmark_tiff(file_path: str):
+    """
+    Compares saving all stacks as 8 bit TIFF files with Pillow (uncompressed, one file per stack and plane, as in the
+    obf-to-tif scripts) with writing them into one tiled OME-TIFF file (converted to 8 bit and in their original data
+    type) with different compressions. Prints the write throughput (uncompressed 8 bit data) and the file sizes.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    try:
+        import tifffile  # noqa: F401
+    except ImportError:
+        print('tifffile is not installed, skipping the OME-TIFF benchmark')
+        return
+
+    obf = obf_support.File(file_path)
+    stacks = [stack for stack in obf.stacks if stack.dimensionality >= 2]
+    groups = {}
+    for stack in stacks:
+        groups.setdefault((stack.shape, stack.data_type), []).append(stack)
+    nbytes = sum(int(np.prod(stack.shape)) for stack in stacks)
+
+    def with_pillow(directory):
+        for stack in stacks:
+            array = stack.as_array(order='native')
+            planes = array.reshape((-1,) + array.shape[-2:])
+            for idx, plane in enumerate(planes):
+                a = np.clip(plane, 0, 255).astype(np.uint8)
+                Image.fromarray(a).save(os.path.join(directory, '{}_{}.tiff'.format(stack.name, idx)), format='tiff')
+
+    def with_tifffile(compression, dtype):
+        def write(directory):
+            for idx, group in enumerate(groups.values()):
+                obf_export.write_ome_tiff(group, os.path.join(directory, '{}.ome.tif'.format(idx)),
+                                          compression=compression, dtype=dtype)
+        return write
+
+    variants = [('pillow', with_pillow)] if Image is not None else []
+    for compression in (None, 'zlib', 'zstd', 'lzw'):
+        for dtype in (np.uint8, None):
+            variants.append(('{} {}'.format(compression or 'raw', 'uint8' if dtype else 'original'),
+                             with_tifffile(compression, dtype)))
+    print('saving stacks of {} as TIFF'.format(file_path))
+    for label, write in variants:
+        with tempfile.TemporaryDirectory() as directory:
+            try:
+                seconds, _ = measure(lambda: write(directory), repeats=1, trace_memory=False)
+            except (ImportError, ValueError, KeyError) as error:  # codec not available
+                print('  {:<16} skipped ({})'.format(label, error))
+                continue
+            size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print('  {:<16} {:8.3f} s, {:8.1f} MB/s, file size {:8.1f} MB'.format(
+            label, seconds, nbytes / seconds / 1e6, size / 1e6))
+    obf.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        benchmark_open(sys.argv[1])
+        benchmark_stack_table(sys.argv[1])
+        benchmark_read(sys.argv[1])
+        benchmark_parallel_inflate(sys.argv[1])
+        benchmark_orientation(sys.argv[1])
+        benchmark_convert(sys.argv[1])
+        benchmark_planes(sys.argv[1])
+        benchmark_projections(sys.argv[1])
+        validate_read(sys.argv[1])
+        benchmark_lazy(sys.argv[1])
+        benchmark_metadata(sys.argv[1])
+        benchmark_ome_zarr(sys.argv[1])
+        benchmark_tiff(sys.argv[1])
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'synthetic.obf')
+            write_obf(path, [{'name': 'STED', 'data': synthetic_image((4000, 4000))}])
+            benchmark_read(path)
+            benchmark_orientation(path)
+            benchmark_convert(path)
+
+            path = os.path.join(directory, 'synthetic_flush_points.obf')
+            write_obf(path, [{'name': 'STED', 'data': synthetic_image((4000, 4000)), 'flush_block_size': 1 << 20}])
+            benchmark_parallel_inflate(path)
+
+            path = os.path.join(directory, 'synthetic_time_series.obf')
+            write_obf(path, [{'name': 'STED', 'data': synthetic_image((512, 512, 200))}])
+            benchmark_planes(path)
+            benchmark_projections(path)
+            benchmark_ome_zarr(path)
+            benchmark_tiff(path)
+
+            path = os.path.join(directory, 'synthetic_time_series_flush_points.obf')
+            write_obf(path, [{'name': 'STED', 'data': synthetic_image((512, 512, 200)), 'flush_block_size': 1 << 20}])
+            validate_read(path)
+            benchmark_lazy(path)
+
+            path = os.path.join(directory, 'synthetic_uncompressed.obf')
+            write_obf(path, [{'name': 'STED', 'data': synthetic_image((512, 512, 20)), 'compression': False}])
+            validate_read(path)
+
+            path = os.path.join(directory, 'synthetic_chunked.obf')
+            arrays = [synthetic_image((512, 512, 20)) for _ in range(3)]
+            write_obf(path, [{'name': 'STED', 'data': arrays[0], 'compression': False, 'chunk_size': 100000},
+                             {'name': 'STED deflate', 'data': arrays[1], 'chunk_size': 100000},
+                             {'name': 'STED flush', 'data': arrays[2], 'chunk_size': 100000,
+                              'flush_block_size': 1 << 19}])
+            validate_chunked(path, arrays)
+            validate_read(path)
+
+            path = os.path.join(directory, 'synthetic_many_stacks.obf')
+            write_obf(path, [{'name': 'Channel {}'.format(idx), 'data': synthetic_image((64, 64))}
+                             for idx in range(500)])
+            benchmark_open(path)
+            benchmark_stack_table(path)
+
+            path = os.path.join(directory, 'synthetic_many_flush_points.obf')
+            write_obf(path, [{'name': 'STED', 'data': synthetic_image((1000, 800)), 'flush_block_size': 16}])
+            benchmark_metadata(path)
@@ -39,8 +39,7 @@ def main():
 
         # now load all the wanted stacks, turn them into numpy arrays and get the exact name.
         for stack in wanted_stacks:
-            array = stack.data  # this is where Jan does the magic of converting obf to numpy
-            array = numpy.transpose(array)  # need to transpose to have in the original orientation
+            array = stack.as_array(order='native')  # this is where Jan does the magic of converting obf to numpy, already in the original orientation
             stackname = stack.name
 
 